@@ -556,6 +556,7 @@ private:
         RPC_REQ_GET_STATS = 3,
         RPC_REQ_SET_FLAGS = 4,
         RPC_REQ_SET_MONITOR_CONFIG = 5,
+        RPC_REQ_READ_CSTR = 6,
     };
 
     struct rpc_req {
@@ -566,6 +567,12 @@ private:
                 uint64_t len;
                 char data[0];
             } __attribute__((packed)) read;
+            // read_cstr: same as read, but len is a maximum, and the
+            // response stops after the first NUL
+            struct {
+                uint64_t addr;
+                uint64_t max_len;
+            } __attribute__((packed)) read_cstr;
             struct {
                 uint64_t addr;
                 char data[0];
@@ -588,9 +595,11 @@ private:
             goto err;
         }
         switch (req->type) {
-        case RPC_REQ_READ: {
+        case RPC_REQ_READ:
+        case RPC_REQ_READ_CSTR: {
+            static_assert(offsetof_end(rpc_req, read) == offsetof_end(rpc_req, read_cstr));
             if (len != offsetof_end(rpc_req, read)) {
-                err = "wrong len for read";
+                err = req->type == RPC_REQ_READ ? "wrong len for read" : "wrong len for read_cstr";
                 goto err;
             }
             size_t read_len = req->read.len;
@@ -610,6 +619,13 @@ private:
             uint8_t *header = c->send.buf + c->send.len;
             uint8_t *expected_body = header + header_len;
             size_t actual = safe_memcpy(expected_body, false, (void *)req->read.addr, true, read_len);
+            if (req->type == RPC_REQ_READ_CSTR) {
+                // Keep the NUL, so the client can tell a whole string from
+                // one cut short by max_len or by unreadable memory.
+                if (auto nul = (uint8_t *)memchr(expected_body, 0, actual)) {
+                    actual = nul + 1 - expected_body;
+                }
+            }
             uint8_t *actual_body = fill_ws_header(header, actual);
             if (actual_body != expected_body) {
                 // The actual size required a smaller WebSocket header.
@@ -4,6 +4,7 @@
 # ]
 # ///
 
+import os
 import smmboss
 import guest_access
 
@@ -97,6 +98,49 @@ def json_info_for_build(build_id, classes_to_export):
         **smmboss.get_addrs_yaml()[build_id],
     }
 
+def _file_digest(path):
+    import hashlib
+    with open(path, 'rb') as fp:
+        return hashlib.sha256(fp.read()).hexdigest()
+
+def cached_json_info_for_build(build_id, classes_to_export):
+    '''
+    json_info_for_build, but reusing the result from last time (kept in
+    __pycache__) if the files it was built from are unchanged, which saves
+    building a world for the build.
+    '''
+    import json
+    from pathlib import Path
+    cache_path = Path(__file__).parent / '__pycache__' / f'export-{build_id}.json'
+    key = {
+        'classes_to_export': list(classes_to_export),
+        'addrs_yaml': _file_digest(smmboss.addrs_yaml_path()),
+        'modules': [_file_digest(mod.__file__) for mod in (smmboss, guest_access)] +
+                   [_file_digest(__file__)],
+    }
+    try:
+        with open(cache_path) as fp:
+            cached = json.load(fp)
+        if (cached['key'] == key and
+            all(_file_digest(path) == digest for (path, digest) in cached['deps'].items())):
+            # still report them as deps (see main)
+            for path in cached['deps']:
+                guest_access.extra_dep_filenames[path] = os.path.getmtime(path)
+            return cached['info']
+    except (OSError, ValueError, KeyError):
+        pass
+    info = json_info_for_build(build_id, classes_to_export)
+    deps = {path: _file_digest(path) for path in guest_access.extra_dep_filenames}
+    try:
+        cache_path.parent.mkdir(exist_ok=True)
+        tmp_path = cache_path.with_name(f'{cache_path.name}.{os.getpid()}')
+        with open(tmp_path, 'w') as fp:
+            json.dump({'key': key, 'deps': deps, 'info': info}, fp)
+        os.replace(tmp_path, cache_path)
+    except OSError:
+        pass
+    return info
+
 def build_id_for_version(version):
     rets = [build_id for (build_id, info) in smmboss.get_addrs_yaml().items()
             if info.get('version') == version]
@@ -115,7 +159,7 @@ ROOT_CLASSES = [
 
 def json_info():
     return {
-        build_id: json_info_for_build(build_id, ROOT_CLASSES)
+        build_id: cached_json_info_for_build(build_id, ROOT_CLASSES)
         for build_id in map(build_id_for_version, RELEVANT_VERSIONS)
     }
 
@@ -1,4 +1,4 @@
-import functools, struct, os, weakref, contextlib, threading, fcntl, json
+import functools, struct, os, sys, weakref, contextlib, threading, fcntl, json, marshal, importlib.util, dis
 
 extra_dep_filenames = {} # path -> mtime
 all_worlds = weakref.WeakKeyDictionary()
@@ -8,19 +8,108 @@ def mark_worlds_stale():
         world.stale_code = True
 
 def mark_worlds_stale_if_necessary():
-    for filename, mtime in extra_dep_filenames.items():
-        if os.path.getmtime(filename) != mtime:
-            mark_worlds_stale()
+    for world in all_worlds:
+        if world.changed_files():
+            world.stale_code = True
 
 class World:
     def __init__(self):
         self.stale_code = False
+        self._imported = {} # path -> mtime, in import order
+        self._defined = {} # path -> names its top level assigns
         all_worlds[self] = None
     def _import(self, filename):
         filename = os.path.join(os.path.dirname(__file__), filename)
-        extra_dep_filenames[filename] = os.path.getmtime(filename) # used by export.py and shell.py
-        code = compile(open(filename).read(), filename, 'exec')
+        mtime = os.path.getmtime(filename)
+        extra_dep_filenames[filename] = mtime # used by export.py
+        self._imported[filename] = mtime
+        code = compile_world_file(filename)
+        self._defined[filename] = _assigned_names(code)
         exec(code, self.__dict__)
+    def changed_files(self):
+        return [filename for (filename, mtime) in self._imported.items()
+                if os.path.getmtime(filename) != mtime]
+    def reload_changed(self):
+        '''
+        Re-exec the first changed file and everything imported after it (which
+        may build on it) into this world, rather than starting a new one, so
+        the earlier files' definitions and anything else in the world (guest,
+        mm, caches the world code chooses to keep) stay as they are.  If
+        nothing changed but we were marked stale, re-exec everything.
+
+        The world code keeps persistent_cache, image_store and cstr_intern's
+        strings.  What's dropped is whatever hangs off the re-exec'd classes
+        and functions, since it refers to the old ones: the instance caches
+        of _instance_cacheable classes and the cached_property memos on
+        those instances, functools caches like ObjRec.by_idee's and
+        _objrec_infos_by_addr's, and the emulator pools.  Names the files no
+        longer assign are deleted.
+        '''
+        filenames = list(self._imported)
+        changed = self.changed_files()
+        first = min(map(filenames.index, changed)) if changed else 0
+        old_names = set().union(*(self._defined[filename] for filename in filenames[first:]))
+        for filename in filenames[first:]:
+            self._import(filename)
+        for name in old_names - set().union(*self._defined.values()):
+            self.__dict__.pop(name, None)
+        self.stale_code = False
+
+def _assigned_names(code, top_level=True):
+    # The global names a file's code can assign (or import, def, etc.):
+    # names stored at the top level, and names declared global and stored
+    # in functions.  (Class bodies' STORE_NAMEs are class attributes.)
+    names = set()
+    store_ops = ('STORE_NAME', 'STORE_GLOBAL') if top_level else ('STORE_GLOBAL',)
+    for ins in dis.get_instructions(code):
+        if ins.opname in store_ops:
+            names.add(ins.argval)
+    for const in code.co_consts:
+        if isinstance(const, type(code)):
+            names |= _assigned_names(const, top_level=False)
+    return names
+
+_code_cache = {} # path -> ((mtime_ns, size), code)
+
+def compile_world_file(filename):
+    '''
+    Compile a file to be exec'd into a World, reusing the code from last time
+    if the file hasn't changed: in memory by mtime and size, and across
+    processes through a marshalled copy in __pycache__ keyed by the source's
+    hash (like a hash-based .pyc).
+    '''
+    st = os.stat(filename)
+    stat_key = (st.st_mtime_ns, st.st_size)
+    cached = _code_cache.get(filename)
+    if cached is not None and cached[0] == stat_key:
+        return cached[1]
+    with open(filename, 'rb') as fp:
+        source = fp.read()
+    header = importlib.util.MAGIC_NUMBER + importlib.util.source_hash(source)
+    cache_path = os.path.join(os.path.dirname(filename), '__pycache__',
+        f'{os.path.basename(filename)}.{sys.implementation.cache_tag}.world')
+    code = None
+    try:
+        with open(cache_path, 'rb') as fp:
+            data = fp.read()
+        if data.startswith(header):
+            code = marshal.loads(data[len(header):])
+            if code.co_filename != filename:
+                code = None
+    except (OSError, ValueError, EOFError, TypeError):
+        pass
+    if code is None:
+        code = compile(source, filename, 'exec')
+        try:
+            os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+            tmp_path = f'{cache_path}.{os.getpid()}'
+            with open(tmp_path, 'wb') as fp:
+                fp.write(header + marshal.dumps(code))
+            os.replace(tmp_path, cache_path)
+        except OSError:
+            pass
+    _code_cache[filename] = (stat_key, code)
+    return code
 
 @functools.total_ordering
 class Guest:
@@ -33,6 +122,17 @@ class Guest:
         if len(data) != size:
             raise Exception('only read %#x/%#x bytes @ %#x' % (len(data), size, addr))
         return data
+    def try_read_many(self, ranges):
+        # Subclasses that can do better than one read at a time (e.g. by
+        # pipelining requests) override this.
+        return [self.try_read(addr, size) for (addr, size) in ranges]
+    def read_many(self, ranges):
+        ranges = list(ranges)
+        datas = self.try_read_many(ranges)
+        for (addr, size), data in zip(ranges, datas):
+            if len(data) != size:
+                raise Exception('only read %#x/%#x bytes @ %#x' % (len(data), size, addr))
+        return datas
     def write(self, addr, data):
         actual = self.try_write(addr, data)
         if actual != len(data):
@@ -59,6 +159,23 @@ class Guest:
         #print(repr(data))
         return data[:data.index(b'\0')]
 
+    def read_cstrs(self, addrs):
+        '''
+        read_cstr for each of addrs.  By default, the first chunk of each
+        string is read with one batch of try_read_many, and only strings that
+        don't fit in it cost more reads.
+        '''
+        addrs = list(addrs)
+        datas = self.try_read_many([(addr, 0x40 - (addr & 0x1f)) for addr in addrs])
+        ret = []
+        for addr, data in zip(addrs, datas):
+            nul = data.find(b'\0')
+            if nul != -1:
+                ret.append(bytes(data[:nul]))
+            else:
+                ret.append(bytes(data) + self.read_cstr(addr + len(data)))
+        return ret
+
     def __hash__(self):
         return id(self)
 
@@ -69,10 +186,16 @@ def make_guest_access_world(guest):
     return world
 
 class CachingGuest(Guest):
-    def __init__(self, backing, imaginary_mode=False):
+    def __init__(self, backing, imaginary_mode=False, image_store=None):
         super().__init__()
         self.backing = backing
         self.chunk_size = 0x1000
+        # if given, an ImageStore to get pages of immutable segments from
+        # before going to the backing guest (and to save them in)
+        self.image_store = image_store
+        assert image_store is None or image_store.page_size == self.chunk_size
+        # cap on a single backing read when filling several chunks at once
+        self.max_read_size = 0x8000
         self.cache = {}
         self.active_count = 1 if imaginary_mode else 0
         # if imaginary_mode is True, we won't actually write back any changes,
@@ -84,10 +207,62 @@ class CachingGuest(Guest):
         assert self.active_count
         self.read(addr, size)
 
+    def cache_regions(self, ranges):
+        assert self.active_count
+        self.try_read_many(ranges)
+
+    def try_read_many(self, ranges):
+        if not self.active_count:
+            assert not self.imaginary_mode
+            return self.backing.try_read_many(ranges)
+        ranges = list(ranges)
+        # Fetch every missing chunk with one batch of backing reads, merging
+        # adjacent chunks, then serve the ranges from the cache.
+        missing = set()
+        for addr, size in ranges:
+            self._fill_from_image_store(addr, size)
+            chunk_addr = addr - (addr % self.chunk_size)
+            while chunk_addr < addr + size:
+                if chunk_addr not in self.cache:
+                    missing.add(chunk_addr)
+                chunk_addr += self.chunk_size
+        runs = []
+        for chunk_addr in sorted(missing):
+            if (runs and runs[-1][0] + runs[-1][1] == chunk_addr and
+                runs[-1][1] < self.max_read_size):
+                runs[-1][1] += self.chunk_size
+            else:
+                runs.append([chunk_addr, self.chunk_size])
+        for (run_addr, _), read_data in zip(runs, self.backing.try_read_many(runs)):
+            # keep whatever whole chunks we got; try_read will find out
+            # about the rest
+            for off in range(0, len(read_data) - self.chunk_size + 1, self.chunk_size):
+                self._add_chunk(run_addr + off, read_data[off:off+self.chunk_size])
+        return [self.try_read(addr, size) for (addr, size) in ranges]
+
+    def _fill_from_image_store(self, addr, size):
+        store = self.image_store
+        if store is None:
+            return
+        chunk_addr = addr - (addr % self.chunk_size)
+        while chunk_addr < addr + size:
+            if chunk_addr not in self.cache:
+                page = store.read_page(chunk_addr)
+                if page is not None:
+                    self.cache[chunk_addr] = bytearray(page)
+            chunk_addr += self.chunk_size
+
+    def _add_chunk(self, chunk_addr, data):
+        # (before any imaginary writes to it, so the store gets the real data)
+        self.cache[chunk_addr] = bytearray(data)
+        if self.image_store is not None:
+            self.image_store.write_page(chunk_addr, data)
+
     def try_read(self, addr, size):
         if not self.active_count:
             assert not self.imaginary_mode
             return self.backing.try_read(addr, size)
+        self._fill_from_image_store(addr, size)
         ret = b''
         chunk_addr = addr - (addr % self.chunk_size)
         need_read_start = None
@@ -102,7 +277,7 @@ class CachingGuest(Guest):
                 if len(read_data) != read_size:
                     break
                 for off in range(0, read_size, self.chunk_size):
-                    self.cache[chunk_addr + off] = bytearray(read_data[off:off+self.chunk_size])
+                    self._add_chunk(chunk_addr + off, read_data[off:off+self.chunk_size])
                 ret += read_data
                 chunk_addr += read_size
             else:
@@ -132,6 +307,16 @@ class CachingGuest(Guest):
         else:
             return self.backing.try_write(addr, data)
 
+    def read_cstr(self, addr):
+        if not self.active_count:
+            return self.backing.read_cstr(addr)
+        return super().read_cstr(addr)
+
+    def read_cstrs(self, addrs):
+        if not self.active_count:
+            return self.backing.read_cstrs(addrs)
+        return super().read_cstrs(addrs)
+
     def __enter__(self):
         self.active_count += 1
     def __exit__(self, exc_type, exc_value, traceback):
@@ -145,44 +330,267 @@ class CachingGuest(Guest):
     def par_map(self, *args, **kwargs):
         return self.backing.par_map(*args, **kwargs)
 
+class ImageStore:
+    '''
+    On-disk copies of the immutable segments (code and read-only data) of
+    the guest's images, memory-mapped, and filled in a page at a time as
+    they're read, so each page is fetched from the guest at most once per
+    build.  Each segment is <dir>/<build_id>-<loadout>.<kind>, a sparse file
+    the size of the segment, plus <build_id>-<loadout>.<kind>.pages, a byte
+    per page saying whether it's there yet.  The loadout is a hash of the
+    build IDs of all the images, since the hooks exlaunch installs are
+    patched into the game's code, so it depends on the subsdk build too.
+    '''
+    page_size = 0x1000
+
+    def __init__(self, path, image_infos):
+        self.path = path
+        self.segments = [] # (start, end, data mmap, pages mmap), sorted
+        os.makedirs(path, exist_ok=True)
+        build_ids = []
+        for info in image_infos:
+            build_id = info.get('build_id')
+            if isinstance(build_id, bytes):
+                # from RPCGuest.parse_hello; see MM.extract_image_info
+                build_id = (build_id + b'\0'*16).hex() if any(build_id) else None
+            build_ids.append(build_id)
+        import hashlib
+        loadout = hashlib.blake2b(repr(build_ids).encode(), digest_size=8).hexdigest()
+        for info, build_id in zip(image_infos, build_ids):
+            if build_id is None:
+                continue
+            for kind in ('text', 'rodata'):
+                start, end = info.get(f'{kind}_start'), info.get(f'{kind}_end')
+                if start is None or end is None or start % self.page_size or end <= start:
+                    continue
+                data, pages = self._open_segment(f'{build_id}-{loadout}.{kind}', end - start)
+                self.segments.append((start, end, data, pages))
+        self.segments.sort(key=lambda seg: seg[0])
+        self.starts = [seg[0] for seg in self.segments]
+        # the span of all the segments, for a quick check that rules out
+        # most addresses (the heap, stacks) before looking any further
+        self.lo = self.segments[0][0] if self.segments else 0
+        self.hi = max((seg[1] for seg in self.segments), default=0)
+
+    def may_contain(self, addr, size):
+        return self.lo <= addr and addr + size <= self.hi
+
+    def _open_segment(self, name, size):
+        import mmap
+        npages = (size + self.page_size - 1) // self.page_size
+        ret = []
+        for (filename, filesize) in [(name, size), (f'{name}.pages', npages)]:
+            fd = os.open(os.path.join(self.path, filename), os.O_RDWR | os.O_CREAT, 0o644)
+            try:
+                if os.fstat(fd).st_size != filesize:
+                    os.ftruncate(fd, filesize)
+                ret.append(mmap.mmap(fd, filesize))
+            finally:
+                os.close(fd)
+        return ret
+
+    def _find(self, addr):
+        import bisect
+        i = bisect.bisect_right(self.starts, addr) - 1
+        if i >= 0:
+            start, end, data, pages = self.segments[i]
+            # only whole pages are stored
+            if addr + self.page_size <= end:
+                return start, data, pages
+        return None
+
+    def read_page(self, addr):
+        '''The page at addr (page-aligned), if it's been stored, else None.'''
+        found = self._find(addr)
+        if found is None:
+            return None
+        start, data, pages = found
+        off = addr - start
+        if not pages[off // self.page_size]:
+            return None
+        return data[off:off+self.page_size]
+
+    def missing_pages(self, addr, size):
+        '''
+        The pages that reading size bytes at addr needs and that haven't been
+        stored yet, or None if they aren't all within our segments.
+        '''
+        ret = []
+        page = addr - (addr % self.page_size)
+        while page < addr + size:
+            found = self._find(page)
+            if found is None:
+                return None
+            start, data, pages = found
+            if not pages[(page - start) // self.page_size]:
+                ret.append(page)
+            page += self.page_size
+        return ret
+
+    def read(self, addr, size):
+        '''size bytes at addr, which must all be stored (see missing_pages)'''
+        ret = b''
+        while size:
+            start, data, pages = self._find(addr - (addr % self.page_size))
+            off = addr - start
+            n = min(size, self.page_size - (addr % self.page_size))
+            ret += data[off:off+n]
+            addr += n
+            size -= n
+        return ret
+
+    def write_page(self, addr, page):
+        found = self._find(addr)
+        if found is None or len(page) != self.page_size:
+            return
+        start, data, pages = found
+        off = addr - start
+        data[off:off+self.page_size] = page
+        pages[off // self.page_size] = 1
+
 class PersistentCache:
+    '''
+    A cache of values that never change for a given build (like what some
+    function in the game returns), shared between processes.  Each build
+    gets its own append-only log, <dir>/<build_id>.jsonl, of [key, value]
+    lines, so only the current build's entries are ever loaded; on a miss,
+    only what other processes appended since is read.  Later lines win, and
+    duplicates are compacted away when there are enough of them.
+    '''
     def __init__(self, path, build_id):
-        self.path = path
+        self.path = os.path.join(path, f'{build_id}.jsonl')
+        self.lock_path = os.path.join(path, f'{build_id}.lock')
         self.build_id = build_id
         self.lock = threading.Lock()
-        with open(self.path) as fp:
-            with self.flock(fp):
-                self.load(fp)
+        self.pending = {} # key -> Future, for keys some thread is computing
+        self.cache = {}
+        self.inode = None
+        self.offset = 0
+        self.nlines = 0
+        os.makedirs(path, exist_ok=True)
+        with self.flock():
+            # (the log is created by the first store, so worlds that only
+            # read, like export.py's, don't leave empty ones around)
+            if not os.path.exists(self.path):
+                return
+            with open(self.path, 'rb') as fp:
+                self.catch_up(fp)
+            if self.nlines > 2 * len(self.cache) + 1000:
+                self.compact_locked()
 
     @contextlib.contextmanager
-    def flock(self, fp):
-        fcntl.flock(fp, fcntl.LOCK_EX)
-        try:
-            yield
-        finally:
-            fcntl.flock(fp, fcntl.LOCK_UN)
+    def flock(self):
+        # A separate lock file, since compaction replaces the log.
+        with open(self.lock_path, 'a') as fp:
+            fcntl.flock(fp, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(fp, fcntl.LOCK_UN)
 
-    def load(self, fp):
-        self.cache = {}
-        for line in fp:
+    def catch_up(self, fp):
+        # Read whatever was appended since we last looked (or everything, if
+        # the log was replaced).
+        st = os.fstat(fp.fileno())
+        if st.st_ino != self.inode or st.st_size < self.offset:
+            self.cache = {}
+            self.inode = st.st_ino
+            self.offset = 0
+            self.nlines = 0
+        fp.seek(self.offset)
+        data = fp.read()
+        data = data[:data.rfind(b'\n') + 1]
+        for line in data.splitlines():
             if line:
                 key, val = json.loads(line)
                 self.cache[tuple(key)] = val
+                self.nlines += 1
+        self.offset += len(data)
+
+    def compact(self):
+        with self.lock:
+            with self.flock():
+                with open(self.path, 'ab+') as fp:
+                    self.catch_up(fp)
+                self.compact_locked()
+
+    def compact_locked(self):
+        tmp_path = f'{self.path}.{os.getpid()}'
+        with open(tmp_path, 'wb') as fp:
+            fp.write(''.join(json.dumps([key, val]) + '\n' for (key, val) in self.cache.items()).encode())
+        os.replace(tmp_path, self.path)
+        st = os.stat(self.path)
+        self.inode = st.st_ino
+        self.offset = st.st_size
+        self.nlines = len(self.cache)
+
+    def store_many(self, items):
+        # Append all of items with one write, except for keys someone else
+        # stored in the meantime; returns the values that ended up cached.
+        with self.lock:
+            with self.flock():
+                with open(self.path, 'ab+') as fp:
+                    self.catch_up(fp)
+                    lines = []
+                    for key, val in items.items():
+                        if key not in self.cache:
+                            self.cache[key] = val
+                            lines.append(json.dumps([key, val]) + '\n')
+                    fp.write(''.join(lines).encode())
+                    self.offset = fp.tell()
+                    self.nlines += len(lines)
+            return {key: self.cache[key] for key in items}
 
     def get(self, *key, compute):
-        key = (self.build_id, *key)
         with self.lock:
             if key in self.cache:
                 return self.cache[key]
-        val = compute()
+        return self.get_many([key], lambda key: compute())[0]
+
+    def get_many(self, keys, compute=None, par_map=map, compute_many=None):
+        '''
+        The values for keys, computing the missing ones with compute(key),
+        run through par_map (e.g. guest.par_map), or all at once with
+        compute_many(keys), which returns a list of values; then storing them
+        all with one append.  Keys that another thread is already computing
+        are waited for rather than computed twice.
+        '''
+        assert (compute is None) != (compute_many is None)
+        from concurrent.futures import Future
+        keys = [tuple(key) for key in keys]
+        results = {}
+        mine = {}
+        theirs = {}
         with self.lock:
-            if key in self.cache:
-                return self.cache[key]
-            with open(self.path, 'a+') as fp:
-                with self.flock(fp):
-                    self.load(fp)
-                    if key in self.cache:
-                        return self.cache[key]
-                    fp.write(json.dumps([key, val]) + '\n')
-                    self.cache[key] = val
-        return self.cache[key]
+            for key in keys:
+                if key in results or key in mine or key in theirs:
+                    continue
+                if key in self.cache:
+                    results[key] = self.cache[key]
+                elif (future := self.pending.get(key)) is not None:
+                    theirs[key] = future
+                else:
+                    mine[key] = self.pending[key] = Future()
+        if mine:
+            try:
+                if compute_many is not None:
+                    vals = list(compute_many(list(mine)))
+                else:
+                    vals = list(par_map(compute, list(mine)))
+                stored = self.store_many(dict(zip(mine, vals)))
+            except BaseException as e:
+                with self.lock:
+                    for key in mine:
+                        del self.pending[key]
+                for future in mine.values():
+                    future.set_exception(e)
+                raise
+            with self.lock:
+                for key in mine:
+                    del self.pending[key]
+            for key, future in mine.items():
+                future.set_result(stored[key])
+            results.update(stored)
+        for key, future in theirs.items():
+            results[key] = future.result()
+        return [results[key] for key in keys]
@@ -1,4 +1,4 @@
-import functools, io, sys, struct, inspect, re, os, traceback, time
+import functools, io, sys, struct, inspect, re, os, traceback, time, copy, collections, threading, contextlib, weakref
 
 class GuestPtrMeta(type):
     def __matmul__(self, addr):
@@ -6,26 +6,66 @@ class GuestPtrMeta(type):
         # though it doesn't bind tightly - you would need parens in (Foo@0x1234).bar
         return self(addr)
 
+    def __new__(mcls, name, bases, attributes):
+        # There are a lot of these objects, so keep them small: no __dict__
+        # unless the class declares __slots__ itself or needs one for
+        # functools.cached_property.
+        if '__slots__' not in attributes:
+            needs_dict = (
+                any(isinstance(val, functools.cached_property) for val in attributes.values()) and
+                all(base.__dictoffset__ == 0 for base in bases)
+            )
+            attributes['__slots__'] = ('__dict__',) if needs_dict else ()
+        if attributes.get('_instance_cacheable', False):
+            mcls = CachedGuestPtrMeta
+        return super().__new__(mcls, name, bases, attributes)
+
+class CachedGuestPtrMeta(GuestPtrMeta):
+    # For classes with _instance_cacheable set: constructing one returns the
+    # existing instance for that address (along with anything it has
+    # memoized), as long as it's one of the _instance_cache_size most
+    # recently used.  Other classes skip this and use type.__call__.
     def __init__(cls, name, bases, attributes):
         super().__init__(name, bases, attributes)
-        if getattr(cls, '_instance_cacheable', False):
-            cls._instance_cache = {}
-        else:
-            cls._instance_cache = None
-    def __call__(cls, *args, **kwargs):
-        if (cache := cls._instance_cache) is not None:
-            assert len(args) == 1 and len(kwargs) == 0
-            addr, = args
+        cls._instance_cache = collections.OrderedDict()
+        cls._instance_cache_lock = threading.Lock()
+    def __call__(cls, addr):
+        cache = cls._instance_cache
+        with cls._instance_cache_lock:
             obj = cache.get(addr)
-            if obj is None:
-                obj = cache[addr] = super().__call__(addr)
-            return obj
-        return super().__call__(*args, **kwargs)
+            if obj is not None:
+                cache.move_to_end(addr)
+                return obj
+        obj = super().__call__(addr)
+        with cls._instance_cache_lock:
+            obj = cache.setdefault(addr, obj)
+            cache.move_to_end(addr)
+            if len(cache) > cls._instance_cache_size:
+                cache.popitem(last=False)
+        return obj
+
+@functools.cache
+def _slot_descriptors(cls):
+    return [
+        klass.__dict__[name]
+        for klass in cls.__mro__
+        for name in klass.__dict__.get('__slots__', ())
+        if name not in ('__dict__', '__weakref__')
+    ]
 
 @functools.total_ordering
 class GuestPtr(metaclass=GuestPtrMeta):
+    # _local is for local views (see load()), (buf, buf_addr): reads of bytes
+    # that lie within buf are served from it instead of going to the guest.
+    __slots__ = ('addr', '_local', '__weakref__')
+    _instance_cache_size = 4096
+
     def __init__(self, addr):
-        self.addr = as_addr(addr)
+        if type(addr) is int and 0 <= addr <= 0xffffffffffffffff:
+            self.addr = addr
+        else:
+            self.addr = as_addr(addr)
+        self._local = None
     def __repr__(self):
         return hex(self.addr)
     def __bool__(self):
@@ -40,10 +80,90 @@ class GuestPtr(metaclass=GuestPtrMeta):
         return self.addr < other.addr
     def __repr__(self):
         return '%s@%#x' % (self.__class__.__name__, self.addr)
+    def __copy__(self):
+        # (copy.copy's default would trip over slots that subclasses shadow
+        # with class attributes, like GuestFixedArray.count)
+        cls = type(self)
+        ret = cls.__new__(cls)
+        for slot in _slot_descriptors(cls):
+            try:
+                slot.__set__(ret, slot.__get__(self, cls))
+            except AttributeError:
+                pass # unset
+        if (d := getattr(self, '__dict__', None)) is not None:
+            ret.__dict__.update(d)
+        return ret
     def cast(self, ty):
-        return ty(self.addr)
+        return make_ptr(ty, self.addr, self._local)
     def raw_offset(self, offset, ty):
-        return ty(as_addr(self.addr + offset))
+        return make_ptr(ty, as_addr(self.addr + offset), self._local)
+
+    def load(self):
+        '''
+        Read the whole object with one guest read and return a local view of
+        it: a copy of this pointer whose reads of primitive fields, nested
+        inline structs and inline arrays are served from the buffer.  Pointers
+        read out of a local view are ordinary remote pointers, which can in
+        turn be load()ed.
+        '''
+        return self.local(stored_try_read_many([(self.addr, self._load_size())])[0])
+
+    def _load_size(self):
+        size = static_sizeof(type(self))
+        if size is None:
+            # e.g. a GuestArray with an instance count
+            size = getattr(self, 'sizeof_star', None)
+            if not isinstance(size, int):
+                raise Exception(f"don't know how much of {self!r} to load")
+        return size
+
+    def local(self, data, data_addr=None):
+        '''
+        Return a local view of this object backed by data, which holds the
+        guest's bytes starting at data_addr (default: our address).  Reads
+        that fall outside data still go to the guest.
+        '''
+        if data_addr is None:
+            data_addr = self.addr
+        ret = copy.copy(self)
+        ret._local = (bytearray(data), data_addr)
+        return ret
+
+    @property
+    def is_local(self):
+        return self._local is not None
+
+    def _read(self, size):
+        if (local := self._local) is not None:
+            buf, buf_addr = local
+            off = self.addr - buf_addr
+            if 0 <= off and off + size <= len(buf):
+                return buf[off:off+size]
+        if (store := image_store) is None or not store.may_contain(self.addr, size):
+            return guest.read(self.addr, size)
+        data = stored_try_read_many([(self.addr, size)])[0]
+        if len(data) != size:
+            raise Exception('only read %#x/%#x bytes @ %#x' % (len(data), size, self.addr))
+        return data
+
+    def _write(self, data):
+        guest.write(self.addr, data)
+        if (local := self._local) is not None:
+            buf, buf_addr = local
+            off = self.addr - buf_addr
+            lo, hi = max(off, 0), min(off + len(data), len(buf))
+            if lo < hi:
+                buf[lo:hi] = data[lo - off : hi - off]
+
+    # prefetch() hooks.  prefetch_children is called on a local view and
+    # yields the remote objects it points to that are worth fetching too.
+    _prefetch_container = False # followed even if not in prefetch's types
+    _prefetch_depth_cost = 1
+    def prefetch_children(self):
+        return ()
+    def _prefetch_size(self):
+        return self._load_size()
+
     def dump_str(self):
         fp = io.StringIO()
         dump(self, fp)
@@ -51,9 +171,9 @@ class GuestPtr(metaclass=GuestPtrMeta):
 
 class GuestPrimPtr(GuestPtr):
     def get(self):
-        return self.decode_data(guest.read(self.addr, self.sizeof_star))
+        return self.decode_data(self._read(self.sizeof_star))
     def set(self, val):
-        return guest.write(self.addr, self.encode_data(val))
+        return self._write(self.encode_data(val))
     def dump(self, fp, indent, **opts):
         fp.write(f'{self.__class__.__name__}@{self.addr:#x}')
         if self.addr == 0:
@@ -116,6 +236,7 @@ def ptr_to(ptr_ty):
 GuestPtrPtr = ptr_to(GuestPtr)
 
 class GuestArray(GuestPtr):
+    __slots__ = ('ptr_ty', 'count')
     def __init__(self, addr, ptr_ty=None, count=None):
         super().__init__(addr)
         if ptr_ty is not None:
@@ -132,7 +253,9 @@ class GuestArray(GuestPtr):
             if start < 0: start += self.count
             if stop < 0: start += self.count
             assert start <= stop
-            return GuestArray(self.addr + start * self.ptr_ty.sizeof_star, self.ptr_ty, stop - start)
+            ret = GuestArray(self.base.addr + start * self.ptr_ty.sizeof_star, self.ptr_ty, stop - start)
+            ret._local = self.base._local
+            return ret
         item = self.ptr_at(n, unchecked=unchecked)
         if hasattr(item, 'get'):
             item = item.get() # xxx
@@ -150,7 +273,7 @@ class GuestArray(GuestPtr):
             yield self[i]
     @property
     def base(self):
-        return self.ptr_ty(self.addr)
+        return make_ptr(self.ptr_ty, self.addr, self._local)
     def __len__(self):
         return self.count
     @property
@@ -164,30 +287,82 @@ class GuestArray(GuestPtr):
         sizeof_elm = self.ptr_ty.sizeof_star
         if decoder is None:
             decoder = self.ptr_ty.decode_data
-        raw_data = guest.read(self.base.addr, count * sizeof_elm)
+        raw_data = self.base._read(count * sizeof_elm)
         out = []
         for i in range(0, count * sizeof_elm, sizeof_elm):
             out.append(decoder(raw_data[i:i+sizeof_elm]))
         return out
     def cache_all(self):
         guest.cache_region(self.base.addr, self.count * self.ptr_ty.sizeof_star)
+    def as_array(self):
+        '''The items as a numpy array of numpy_dtype(ptr_ty), from one read.'''
+        import numpy as np
+        base = self.base
+        size = self.count * self.ptr_ty.sizeof_star
+        local = base._local
+        if local is not None and 0 <= base.addr - local[1] <= len(local[0]) - size:
+            data = base._read(size)
+        else:
+            data = try_read_chunked(base.addr, size)
+            if len(data) != size:
+                raise Exception('only read %#x/%#x bytes @ %#x' % (len(data), size, base.addr))
+        return np.frombuffer(data, dtype=numpy_dtype(self.ptr_ty))
+    def load_items(self):
+        '''
+        Like load(), but for the items rather than whatever holds the count and
+        base pointer: returns a plain GuestArray over the items that is a local
+        view, made with one read.
+        '''
+        base = self.base
+        ret = GuestArray(base.addr, self.ptr_ty, self.count)
+        if base._local is not None:
+            ret._local = base._local
+            return ret
+        return ret.local(try_read_chunked(base.addr, ret.sizeof_star))
     def dump(self, fp, indent, **opts):
         count = self.count
         fp.write('array (%#x, count=%u):' % (self.addr, count))
         if self.addr == 0:
             fp.write(' (null)')
             return
+        items = self._loaded_items()
         indent2 = indent + '  '
         for i in range(count):
-            if not self.should_dump_ith(i):
+            if not items.should_dump_ith(i):
                 continue
             fp.write('\n%s[%d] = ' % (indent2, i))
-            item = self[i]
+            item = items[i]
             dump(item, fp, indent2, **opts)
             fp.write(',')
     def should_dump_ith(self, i):
         return True # subclass hook
 
+    _prefetch_container = True
+    def prefetch_children(self):
+        if not self.count:
+            return
+        base = self.base
+        if base.addr != self.addr:
+            # out-of-line items: fetch them as an array of their own
+            if base:
+                yield GuestArray(base.addr, self.ptr_ty, self.count)
+            return
+        if static_sizeof(self.ptr_ty) is None:
+            return
+        for i in range(self.count):
+            yield from _prefetch_children_of(self[i])
+    def _loaded_items(self):
+        base = self.base
+        if base._local is not None or static_sizeof(self.ptr_ty) is None:
+            return self
+        try:
+            if base.addr == self.addr:
+                # inline items; keep our class so subclass hooks still apply
+                return self.local(try_read_chunked(self.addr, self.count * self.ptr_ty.sizeof_star))
+            return self.load_items()
+        except Exception:
+            return self
+
 def count4_ptr(ptr_ty):
     pp = ptr_to(ptr_ty)
     class CountPtr(GuestArray, GuestStruct):
@@ -206,9 +381,8 @@ class GuestFixedArrayBase(GuestArray):
 @functools.lru_cache(None)
 def fixed_array(ptr_ty, count):
     class GuestFixedArray(GuestFixedArrayBase):
-        def __init__(self, addr):
-            super().__init__(addr, ptr_ty, count)
         sizeof_star = ptr_ty.sizeof_star * count
+    GuestFixedArray.ptr_ty = ptr_ty
     GuestFixedArray.count = count
     GuestFixedArray.val_ptr_ty = ptr_ty
     GuestFixedArray.__name__ = f'fixed_array({ptr_ty.__name__}, {count})'
@@ -231,7 +405,7 @@ class MyProperty(property):
             self.must_call = False
         return self.ptr_cls_or_f
     def ptr(self, this):
-        return self.ptr_cls(this.addr + self.offset)
+        return make_ptr(self.ptr_cls, this.addr + self.offset, this._local)
     def read(self, this):
         return self.ptr(this).get()
     def write(self, this, value):
@@ -263,6 +437,60 @@ def maybe_call(f):
     else:
         return f()
 
+def make_ptr(ty, addr, local=None):
+    if local is None:
+        return ty(addr)
+    # Local views are never shared, so bypass any instance cache.
+    ret = ty.__new__(ty)
+    ret.__init__(addr)
+    ret._local = local
+    return ret
+
+def static_sizeof(ty):
+    '''
+    Size of the object ty points to, if it's known without reading anything;
+    for structs without a declared sizeof_star, this is the extent of their
+    properties.
+    '''
+    if issubclass(ty, GuestStruct):
+        return ty._static_sizeof()
+    size = getattr(ty, 'sizeof_star', None)
+    return size if isinstance(size, int) else None
+
+@functools.cache
+def numpy_dtype(ty):
+    '''
+    The numpy dtype for raw arrays of ty.  For a struct, that's a structured
+    dtype with a field for each property that has one (primitives, pointers
+    as u64, nested structs and fixed arrays), and the struct's size as its
+    itemsize.
+    '''
+    dtype = _numpy_dtype_or_none(ty)
+    if dtype is None:
+        raise Exception(f'no numpy dtype for {ty.__name__}')
+    return dtype
+
+def _numpy_dtype_or_none(ty):
+    import numpy as np
+    if issubclass(ty, GuestPtrPtrBase):
+        return np.dtype('<u8')
+    if issubclass(ty, GuestPrimPtr):
+        return np.dtype(ty.code)
+    if issubclass(ty, GuestFixedArrayBase):
+        item = _numpy_dtype_or_none(ty.ptr_ty)
+        return None if item is None else np.dtype((item, (ty.count,)))
+    if not issubclass(ty, GuestStruct):
+        return None
+    size = static_sizeof(ty)
+    names, formats, offsets = [], [], []
+    for key, prop in ty._properties():
+        field = _numpy_dtype_or_none(prop.ptr_cls)
+        if field is not None and prop.offset + field.itemsize <= size:
+            names.append(key)
+            formats.append(field)
+            offsets.append(prop.offset)
+    return np.dtype({'names': names, 'formats': formats, 'offsets': offsets, 'itemsize': size})
+
 def as_addr(obj_or_addr):
     if isinstance(obj_or_addr, GuestStruct):
         return obj_or_addr.addr
@@ -275,9 +503,28 @@ class GuestStruct(GuestPtr):
         if self.addr == 0:
             fp.write(' (null)')
             return
+        this = self._loaded_struct()
         indent2 = indent + '  '
         for key, prop in self._properties():
-            prop.dump_field(self, fp, indent2, key, **opts)
+            prop.dump_field(this, fp, indent2, key, **opts)
+
+    def prefetch_children(self):
+        is_array = isinstance(self, GuestArray)
+        for key, prop in self._properties():
+            if is_array and key == 'base':
+                continue # GuestArray.prefetch_children fetches all the items
+            yield from _prefetch_children_of(prop.read(self))
+        if is_array:
+            yield from GuestArray.prefetch_children(self)
+
+    def _loaded_struct(self):
+        if self._local is not None:
+            return self
+        try:
+            return self.load()
+        except Exception:
+            # let the individual fields report what's wrong
+            return self
     def get(self):
         return self
     def set(self, val):
@@ -291,9 +538,10 @@ class GuestStruct(GuestPtr):
         else:
             include_properties = self._include_in_repr_properties()
         if include_properties and self.addr != 0:
+            this = self._loaded_struct() if len(include_properties) > 1 else self
             subreprs = []
             for key, prop in include_properties:
-                subreprs.append(f"{key}={getattr(self, key)!r}")
+                subreprs.append(f"{key}={getattr(this, key)!r}")
             ret += '({})'.format(', '.join(subreprs))
         return ret
 
@@ -324,6 +572,16 @@ class GuestStruct(GuestPtr):
             if isinstance(prop, MyProperty)
         ]
 
+    @classmethod
+    @functools.cache
+    def _static_sizeof(cls):
+        size = getattr(cls, 'sizeof_star', None)
+        if isinstance(size, int):
+            return size
+        return max((prop.offset + (static_sizeof(prop.ptr_cls) or 0)
+                    for (key, prop) in cls._properties()),
+                   default=0)
+
     @classmethod
     def _base_guest_struct(cls):
         base = cls.__bases__[0]
@@ -347,12 +605,87 @@ class GuestCString(GuestPtr):
         addr = self.addr
         if addr == 0:
             return None
-        return guest.read_cstr(self.addr)
+        return read_cstrs([addr])[0]
     def as_str(self):
         return os.fsdecode(self.get())
+    @staticmethod
+    def get_many(cstrs):
+        '''get() a bunch of strings with one batch of reads'''
+        cstrs = list(cstrs)
+        datas = iter(read_cstrs([cstr.addr for cstr in cstrs if cstr.addr]))
+        return [next(datas) if cstr.addr else None for cstr in cstrs]
+    @staticmethod
+    def as_strs(cstrs):
+        return [os.fsdecode(data) for data in GuestCString.get_many(cstrs)]
     def __repr__(self):
         #return '%s %s' % (super().__repr__(), self.get())
         return repr(self.as_str())
+    def _prefetch_size(self):
+        # Enough for most strings; read_cstr reads more if it needs to.
+        return 0x40
+
+class CStringIntern:
+    '''
+    Strings in immutable memory (code and read-only data), remembered by
+    address so each is read at most once.  Those in the main image are also
+    kept in persistent_cache (a PersistentCache for the build), keyed by
+    offset, so a later session doesn't read them at all.
+    '''
+    def __init__(self, mm, persistent_cache=None):
+        self.mm = mm
+        self.persistent_cache = persistent_cache
+        self.immutable_ranges = mm.immutable_ranges()
+        self.strs = {} # addr -> bytes
+
+    def is_immutable(self, addr):
+        return any(start <= addr < end for (start, end) in self.immutable_ranges)
+
+    def read_cstrs(self, addrs):
+        addrs = list(addrs)
+        strs = self.strs
+        other = [] # not interned (yet)
+        persisted = [] # in the main image
+        for addr in addrs:
+            if addr in strs:
+                continue
+            if not self.is_immutable(addr):
+                other.append(addr)
+                continue
+            image_info, offset = self.mm.unslide_ex(addr)
+            if self.persistent_cache is not None and image_info is self.mm.main_image_info:
+                persisted.append(offset)
+            else:
+                other.append(addr)
+        ret = dict(zip(other, guest.read_cstrs(other))) if other else {}
+        if persisted:
+            # all the missing ones with a single read_cstrs
+            main_start = self.mm.main_image_info['image_start']
+            vals = self.persistent_cache.get_many(
+                [('cstr', offset) for offset in persisted],
+                compute_many=lambda keys: [
+                    data.decode('latin-1')
+                    for data in guest.read_cstrs([main_start + offset for (_, offset) in keys])
+                ],
+            )
+            for offset, val in zip(persisted, vals):
+                strs[main_start + offset] = val.encode('latin-1')
+        for addr in other:
+            if self.is_immutable(addr):
+                strs[addr] = ret[addr]
+        return [strs[addr] if addr in strs else ret[addr] for addr in addrs]
+
+# Set up by smmboss_world, which knows the build.  (Kept when this file is
+# re-exec'd; see World.reload_changed.)
+cstr_intern = globals().get('cstr_intern')
+
+def read_cstrs(addrs):
+    '''
+    guest.read_cstrs, except that strings in immutable memory go through
+    cstr_intern, if there is one.
+    '''
+    if cstr_intern is None:
+        return guest.read_cstrs(addrs)
+    return cstr_intern.read_cstrs(addrs)
 
 class GuestPtrToMemberFunction(GuestStruct):
     # todo: we are not doing a good job distinguishing values and pointers.
@@ -386,6 +719,123 @@ def dump(val, fp=sys.stdout, indent='', **opts):
     if indent == '':
         fp.write('\n') # pfft
 
+def _prefetch_children_of(val):
+    if not isinstance(val, GuestPtr) or not val:
+        return
+    if val._local is not None:
+        # inline in something we already have
+        yield from val.prefetch_children()
+    else:
+        yield val
+
+# The most to ask for in one read: RPCGuest's server can only buffer 64KiB
+# of responses, and drops the connection rather than send more.
+MAX_READ_SIZE = 0x8000
+
+def try_read_chunked(addr, size):
+    '''
+    guest.try_read, for sizes that may be too big to read at once (whole
+    arrays and grids): reads pieces of at most MAX_READ_SIZE, with one batch
+    of reads.
+    '''
+    ranges = [(start, min(MAX_READ_SIZE, addr + size - start))
+              for start in range(addr, addr + size, MAX_READ_SIZE)]
+    ret = bytearray()
+    for (_, chunk_size), data in zip(ranges, stored_try_read_many(ranges)):
+        ret += data
+        if len(data) != chunk_size:
+            break
+    return bytes(ret)
+
+def load_many(ptrs):
+    '''load() a bunch of objects with a single batch of guest reads.'''
+    ptrs = list(ptrs)
+    datas = stored_try_read_many([(ptr.addr, ptr._load_size()) for ptr in ptrs])
+    return [ptr.local(data) for (ptr, data) in zip(ptrs, datas)]
+
+# Set up by smmboss_world: the MM's ImageStore, if it has a guest.
+image_store = globals().get('image_store')
+
+def stored_try_read_many(ranges):
+    '''
+    guest.try_read_many, except that ranges within the images' code and
+    read-only data come from image_store, when there is one, which first
+    gets the pages it doesn't have yet (all with one batch of reads).
+    '''
+    ranges = list(ranges)
+    store = image_store
+    if store is None or not any(store.may_contain(addr, size) for (addr, size) in ranges):
+        return guest.try_read_many(ranges)
+    in_store = []
+    missing = set()
+    for i, (addr, size) in enumerate(ranges):
+        pages = store.missing_pages(addr, size)
+        if pages is not None:
+            in_store.append(i)
+            missing.update(pages)
+    if not in_store:
+        return guest.try_read_many(ranges)
+    missing = sorted(missing)
+    for page, data in zip(missing, guest.try_read_many([(page, store.page_size) for page in missing])):
+        store.write_page(page, data)
+    ret = [None] * len(ranges)
+    for i in in_store:
+        if store.missing_pages(*ranges[i]) == []:
+            ret[i] = store.read(*ranges[i])
+    rest = [i for i in range(len(ranges)) if ret[i] is None]
+    for i, data in zip(rest, guest.try_read_many([ranges[i] for i in rest])):
+        ret[i] = data
+    return ret
+
+def prefetch(root, depth=3, types=None, max_bytes=0x100000):
+    '''
+    Pull root and everything reachable from it through typed pointers, up to
+    depth pointers away, into the active CachingGuest (see `with guest:`).
+    Each level of the graph is fetched with one batch of reads, so a later
+    dump() or walk of the same objects doesn't go to the guest at all.  root
+    may also be a list of objects to start from.  If types is given, only
+    structs of those types are followed (arrays and lists are always
+    walked).  Objects bigger than max_bytes, most likely garbage counts, are
+    skipped.
+    Returns the number of objects fetched.
+    '''
+    if not getattr(guest, 'active_count', 0):
+        raise Exception('prefetch needs an active CachingGuest (use "with guest:")')
+    if types is not None:
+        types = tuple(types)
+    seen = set()
+    roots = root if isinstance(root, list) else [root]
+    frontier = [(obj, 0) for obj in roots]
+    nfetched = 0
+    while frontier:
+        todo = []
+        for obj, obj_depth in frontier:
+            key = (obj.addr, type(obj))
+            if key in seen:
+                continue
+            seen.add(key)
+            try:
+                size = obj._prefetch_size()
+            except Exception:
+                continue
+            if 0 < size <= max_bytes:
+                todo.append((obj, obj_depth, size))
+        datas = guest.try_read_many([(obj.addr, size) for (obj, _, size) in todo])
+        nfetched += len(todo)
+        frontier = []
+        for (obj, obj_depth, size), data in zip(todo, datas):
+            if len(data) != size:
+                continue
+            for child in obj.local(data).prefetch_children():
+                child_depth = obj_depth + child._prefetch_depth_cost
+                if child_depth > depth:
+                    continue
+                if (types is not None and not child._prefetch_container and
+                    not isinstance(child, types)):
+                    continue
+                frontier.append((child, child_depth))
+    return nfetched
+
 class GuestPlusFakeStack:
     def __init__(self, backing):
         self.backing = backing
@@ -395,9 +845,57 @@ class GuestPlusFakeStack:
             return b'\0' * size
         return self.backing.try_read(addr, size)
 
+    def try_read_many(self, ranges):
+        return [self.try_read(addr, size) for (addr, size) in ranges]
+
     def try_write(self, addr, data):
         raise Exception("should not try to write to this")
 
+from guest_access import Guest
+
+class ReadRecordingGuest(Guest):
+    '''
+    Passes reads through to an emulated call's overlay, appending (addr,
+    size, data) for each to reads, where data is what real memory held:
+    parts of the pages the emulation mapped (and may have changed) come from
+    orig_pages, their contents when mapped.  Reads of the fake stack aren't
+    recorded.
+    '''
+    def __init__(self, backing, reads, orig_pages, page_size):
+        super().__init__()
+        self.backing = backing
+        self.reads = reads
+        self.orig_pages = orig_pages
+        self.page_size = page_size
+
+    def _record(self, addr, size, data):
+        if addr + size <= Emulator.stack_top:
+            return
+        real = bytearray(data)
+        page = addr & ~(self.page_size - 1)
+        while page < addr + len(real):
+            orig = self.orig_pages.get(page)
+            if orig is not None:
+                lo, hi = max(addr, page), min(addr + len(real), page + self.page_size)
+                real[lo - addr : hi - addr] = orig[lo - page : hi - page]
+            page += self.page_size
+        self.reads.append((addr, size, bytes(real)))
+
+    def try_read(self, addr, size):
+        data = self.backing.try_read(addr, size)
+        self._record(addr, size, data)
+        return data
+
+    def try_read_many(self, ranges):
+        ranges = list(ranges)
+        datas = self.backing.try_read_many(ranges)
+        for (addr, size), data in zip(ranges, datas):
+            self._record(addr, size, data)
+        return datas
+
+    def try_write(self, addr, data):
+        return self.backing.try_write(addr, data)
+
 @functools.cache
 def unicorn_regs():
     from dataclasses import dataclass
@@ -434,11 +932,322 @@ class RegsWrap:
         self.uregs[reg].write(self.mu, val)
     __setattr__ = set
 
+class RegsSnapshot:
+    # The registers at the end of an emulate_call, after the Emulator has
+    # gone back to the pool.
+    def __init__(self, mu):
+        self.__dict__['vals'] = {name: reg.read(mu) for (name, reg) in unicorn_regs().items()}
+    def get(self, reg):
+        try:
+            return self.vals[reg]
+        except KeyError:
+            raise AttributeError(reg)
+    __getattr__ = get
+
 class Emu:
     pass
 
-# barebones (for now)
-def emulate_call(pc, verbose=False, slide=0, mm=None, stubbed_functions=None, **kwargs):
+class EmuStats:
+    '''
+    Counters for one emulate_call, as emu.stats (and in the message of a
+    timeout).  blocks and instructions are only counted with profile=True or
+    a trace_path, since that needs a per-block hook.
+    '''
+    def __init__(self):
+        self.blocks = None
+        self.instructions = None
+        self.pages_mapped = 0 # pages faulted in from the guest
+        self.reads = 0
+        self.read_bytes = 0
+        self.writes = 0 # dirty pages written back to the overlay
+        self.write_bytes = 0
+        self.stub_hits = collections.Counter() # unslid address -> count
+        self.callback_time = 0.0 # faulting in pages and running stubs
+        self.total_time = 0.0
+
+    @property
+    def jit_time(self):
+        # roughly; this includes the emulation loop's own overhead
+        return self.total_time - self.callback_time
+
+    def __str__(self):
+        parts = []
+        if self.instructions is not None:
+            parts.append(f'{self.instructions} insns in {self.blocks} blocks')
+        parts.append(f'{self.pages_mapped} pages mapped')
+        parts.append(f'{self.reads} reads ({self.read_bytes:#x} bytes)')
+        parts.append(f'{self.writes} writes ({self.write_bytes:#x} bytes)')
+        if self.stub_hits:
+            parts.append('stubs hit: ' + ', '.join(f'{addr:#x} ({count})' for (addr, count) in self.stub_hits.items()))
+        parts.append(f'{self.callback_time*1000:.2f}ms in callbacks of {self.total_time*1000:.2f}ms')
+        return ', '.join(parts)
+
+class Emulator:
+    '''
+    A Unicorn engine for emulate_call, reused from call to call.  Memory
+    starts out unmapped; pages of the (fake) guest are mapped in as the code
+    touches them, after which it runs at full JIT speed.  Pages within
+    immutable_ranges (code and read-only data) stay mapped for later calls;
+    other pages are unmapped again, after copying back any that the code
+    changed into the call's imaginary overlay.
+    '''
+    PAGE_SIZE = 0x1000
+    dummy_ret_addr = 0x1234
+    stack_top = 0x10000
+
+    def __init__(self, immutable_ranges=()):
+        import unicorn
+        self.mu = mu = unicorn.Uc(unicorn.UC_ARCH_ARM64, unicorn.UC_MODE_ARM)
+        self.immutable_ranges = list(immutable_ranges)
+        self.immutable_pages = set()
+        self.pages = {} # mutable page addr -> contents when mapped
+        self.fake_guest = None
+        self.bad_addr = None
+        self.stats = None
+        mu.hook_add(unicorn.UC_HOOK_MEM_UNMAPPED, self._unmapped_cb)
+        # something to "return" to; the stack comes from GuestPlusFakeStack
+        # like everything else
+        mu.mem_map(self.dummy_ret_addr & ~(self.PAGE_SIZE - 1), self.PAGE_SIZE,
+                   unicorn.UC_PROT_READ | unicorn.UC_PROT_EXEC)
+        mu.ctl_exits_enabled(True)
+
+    def _is_immutable(self, page):
+        return any(start <= page and page + self.PAGE_SIZE <= end
+                   for (start, end) in self.immutable_ranges)
+
+    def _unmapped_cb(self, uc, access, addr, size, value, data):
+        start = time.perf_counter()
+        try:
+            return self._map_pages(uc, addr, size)
+        finally:
+            self.stats.callback_time += time.perf_counter() - start
+
+    def _map_pages(self, uc, addr, size):
+        import unicorn
+        stats = self.stats
+        page = addr & ~(self.PAGE_SIZE - 1)
+        while page < addr + size:
+            if page not in self.pages and page not in self.immutable_pages:
+                page_data = self.fake_guest.try_read(page, self.PAGE_SIZE)
+                stats.reads += 1
+                stats.read_bytes += len(page_data)
+                if len(page_data) != self.PAGE_SIZE:
+                    self.bad_addr = addr
+                    return False
+                stats.pages_mapped += 1
+                if self._is_immutable(page):
+                    uc.mem_map(page, self.PAGE_SIZE, unicorn.UC_PROT_READ | unicorn.UC_PROT_EXEC)
+                    self.immutable_pages.add(page)
+                else:
+                    uc.mem_map(page, self.PAGE_SIZE, unicorn.UC_PROT_ALL)
+                    self.pages[page] = page_data
+                uc.mem_write(page, bytes(page_data))
+            page += self.PAGE_SIZE
+        return True
+
+    def _reset(self, fake_guest):
+        import unicorn.arm64_const as ac
+        mu = self.mu
+        for page in self.pages:
+            mu.mem_unmap(page, self.PAGE_SIZE)
+        self.pages = {}
+        self.fake_guest = fake_guest
+        self.bad_addr = None
+        self.stats = EmuStats()
+        for i in range(31):
+            mu.reg_write(getattr(ac, f'UC_ARM64_REG_X{i}'), 0)
+        for i in range(32):
+            mu.reg_write(getattr(ac, f'UC_ARM64_REG_Q{i}'), 0)
+        mu.reg_write(ac.UC_ARM64_REG_NZCV, 0)
+        mu.reg_write(ac.UC_ARM64_REG_SP, self.stack_top)
+        mu.reg_write(ac.UC_ARM64_REG_LR, self.dummy_ret_addr)
+
+    def _recorded_reads(self, read_ranges):
+        # The (addr, size, data) of the bytes in read_ranges that are in
+        # mutable pages other than the fake stack, merged into runs, with
+        # data from before the call changed anything.
+        reads = []
+        for addr, size in sorted(read_ranges):
+            end = addr + size
+            if reads and addr < reads[-1][0] + reads[-1][1]:
+                addr = reads[-1][0] + reads[-1][1]
+            while addr < end:
+                page = addr & ~(self.PAGE_SIZE - 1)
+                hi = min(end, page + self.PAGE_SIZE)
+                orig = self.pages.get(page)
+                if orig is not None and page >= self.stack_top:
+                    data = bytes(orig[addr - page : hi - page])
+                    if reads and reads[-1][0] + reads[-1][1] == addr:
+                        prev_addr, prev_size, prev_data = reads[-1]
+                        reads[-1] = (prev_addr, prev_size + len(data), prev_data + data)
+                    else:
+                        reads.append((addr, len(data), data))
+                addr = hi
+        return reads
+
+    def call(self, pc, fake_guest, verbose=False, unslide=lambda addr: addr,
+             stubbed_functions={}, profile=False, trace_path=None,
+             record_reads=False, **kwargs):
+        import unicorn
+        import unicorn.arm64_const as ac
+        mu = self.mu
+        self._reset(fake_guest)
+        stats = self.stats
+        start_time = time.perf_counter()
+
+        def write_cb(uc, access, addr, size, value, data):
+            print(f">>> write {value:#x} size {size} to {addr:#x}")
+
+        read_ranges = set()
+        def read_cb(uc, access, addr, size, value, data):
+            read_ranges.add((addr, size))
+
+        trace_fp = None
+        def block_cb(uc, addr, size, data):
+            stats.blocks += 1
+            stats.instructions += size // 4
+            if trace_fp is not None:
+                trace_fp.write(f'{unslide(addr):#x}\n')
+
+        def handle_stubbed_function(sf):
+            start = time.perf_counter()
+            stats.stub_hits[unslide(pc)] += 1
+            mu.reg_write(ac.UC_ARM64_REG_X0, sf())
+            stats.callback_time += time.perf_counter() - start
+            return mu.reg_read(ac.UC_ARM64_REG_LR)
+
+        single_step = verbose #or True
+        prev_reg_vals_raw = {}
+
+        max_time = 0.3
+        max_ss_insns = 300
+        cur_ss_insns = 0
+
+        # Everything that attaches to the (pooled) engine goes in the try, so
+        # a failure partway through setup doesn't leave hooks behind.
+        hooks = []
+        try:
+            if trace_path is not None:
+                trace_fp = open(trace_path, 'w')
+            if verbose:
+                hooks.append(mu.hook_add(unicorn.UC_HOOK_MEM_WRITE, write_cb))
+            if record_reads:
+                hooks.append(mu.hook_add(unicorn.UC_HOOK_MEM_READ, read_cb))
+            if profile or trace_fp is not None:
+                stats.blocks = stats.instructions = 0
+                hooks.append(mu.hook_add(unicorn.UC_HOOK_BLOCK, block_cb))
+            rw = RegsWrap(mu)
+            for reg, val in kwargs.items():
+                rw.set(reg, val)
+
+            mu.ctl_set_exits([self.dummy_ret_addr, *stubbed_functions])
+
+            deadline = time.time() + max_time
+
+            while True:
+                if verbose:
+                    print(f'pc={unslide(pc):#x}', end='')
+                    for name, reg in rw.uregs.items():
+                        val_raw = reg.read(mu)
+                        prev = prev_reg_vals_raw.get(name)
+                        if val_raw != prev:
+                            val = rw.get(name)
+                            if isinstance(val, int):
+                                val = hex(val)
+                            print(f' {name}={val}', end='')
+                            prev_reg_vals_raw[name] = val_raw
+                    print()
+                # Outside of single-step mode, use timeout instead of instruction
+                # counter because instruction counter internally forces Unicorn to
+                # single-step.  Not that it really matters since jit will be slow
+                # anyway for this.  Whatever!
+                timeout = int((deadline - time.time()) * 1_000_000)
+                if timeout <= 0:
+                    stats.total_time = time.perf_counter() - start_time
+                    raise Exception(f"took too long ({max_time}s; {stats})")
+                try:
+                    mu.emu_start(begin=pc, until=0, count=1 if single_step else 0, timeout=timeout)
+                except unicorn.UcError as e:
+                    if self.bad_addr is not None:
+                        raise Exception(f'emulated code accessed unreadable address {self.bad_addr:#x}') from e
+                    raise
+                pc = mu.reg_read(ac.UC_ARM64_REG_PC)
+                if pc == self.dummy_ret_addr:
+                    break
+                sf = stubbed_functions.get(pc)
+                if sf is not None:
+                    pc = handle_stubbed_function(sf)
+                cur_ss_insns += 1
+                if cur_ss_insns == max_ss_insns:
+                    stats.total_time = time.perf_counter() - start_time
+                    raise Exception(f"took too long (single-step instruction counter; {stats})")
+        finally:
+            for hook in hooks:
+                mu.hook_del(hook)
+            if trace_fp is not None:
+                trace_fp.close()
+
+        for page, orig in self.pages.items():
+            cur = mu.mem_read(page, self.PAGE_SIZE)
+            if cur != orig:
+                fake_guest.write(page, bytes(cur))
+                stats.writes += 1
+                stats.write_bytes += self.PAGE_SIZE
+
+        stats.total_time = time.perf_counter() - start_time
+        emu = Emu()
+        emu.guest = fake_guest
+        emu.regs = RegsSnapshot(mu)
+        emu.stats = stats
+        if record_reads:
+            emu.reads = self._recorded_reads(read_ranges)
+            emu.orig_pages = dict(self.pages)
+        return emu
+
+class EmulatorPool:
+    '''
+    Idle Emulators for one MM, so each call doesn't pay for setting up an
+    engine and mapping in code.  Thread-safe: concurrent callers (e.g. from
+    par_map) each get their own.
+    '''
+    def __init__(self, immutable_ranges=()):
+        self.immutable_ranges = list(immutable_ranges)
+        self.lock = threading.Lock()
+        self.idle = []
+
+    @contextlib.contextmanager
+    def emulator(self):
+        with self.lock:
+            emulator = self.idle.pop() if self.idle else None
+        if emulator is None:
+            emulator = Emulator(self.immutable_ranges)
+        try:
+            yield emulator
+        finally:
+            with self.lock:
+                self.idle.append(emulator)
+
+_emulator_pools = weakref.WeakKeyDictionary() # MM -> EmulatorPool
+_emulator_pools_lock = threading.Lock()
+_default_emulator_pool = EmulatorPool()
+
+def emulator_pool(mm=None) -> EmulatorPool:
+    if mm is None:
+        return _default_emulator_pool
+    with _emulator_pools_lock:
+        pool = _emulator_pools.get(mm)
+        if pool is None:
+            pool = _emulator_pools[mm] = EmulatorPool(mm.immutable_ranges())
+        return pool
+
+def emulate_call(pc, verbose=False, slide=0, mm=None, stubbed_functions=None,
+                 record_reads=False, profile=False, trace_path=None, **kwargs):
+    '''
+    Emulate a call to pc with the given registers, on top of an imaginary
+    overlay of guest memory; returns an Emu with .regs, .guest (the overlay)
+    and .stats (EmuStats).  profile counts blocks and instructions;
+    trace_path also writes the (unslid) address of each block executed.
+    '''
     if mm is not None:
         slide = mm.slide
         unslide = mm.unslide
@@ -448,104 +1257,78 @@ def emulate_call(pc, verbose=False, slide=0, mm=None, stubbed_functions=None, **
         slide = unslide = lambda addr: addr
         if stubbed_functions is None:
             stubbed_functions = {}
-    import unicorn
-    import unicorn.arm64_const as ac
-    mu = unicorn.Uc(unicorn.UC_ARCH_ARM64, unicorn.UC_MODE_ARM)
 
     from guest_access import CachingGuest
-    fake_guest = CachingGuest(GuestPlusFakeStack(guest), imaginary_mode=True)
-    got_exc = False
+    fake_guest = CachingGuest(GuestPlusFakeStack(guest), imaginary_mode=True,
+                              image_store=mm.image_store if mm is not None else None)
+    with emulator_pool(mm).emulator() as emulator:
+        emu = emulator.call(pc, fake_guest, verbose=verbose, unslide=unslide,
+                            stubbed_functions=stubbed_functions, profile=profile,
+                            trace_path=trace_path, record_reads=record_reads,
+                            **kwargs)
+    if record_reads:
+        # emu.reads lists the guest memory the code read, by the byte rather
+        # than by the page the emulator mapped in, and gets the reads made
+        # through emu.guest after the call too.
+        emu.guest = ReadRecordingGuest(fake_guest, emu.reads, emu.orig_pages,
+                                       Emulator.PAGE_SIZE)
+    return emu
 
-    fake_mem = {}
+def _read_digest(data):
+    import hashlib
+    return hashlib.blake2b(data, digest_size=16).digest()
 
-    def mmio_read_cb(uc, offset, size, data):
-        nonlocal got_exc
-        try:
-            ret = int.from_bytes(fake_guest.read(offset, size), 'little')
-        except:
-            traceback.print_exc()
-            got_exc = True
-            ret = 0
-
-        if verbose and 0:
-            print(f">>> read {size} from {offset:#x} => {ret:#x}")
-        return ret
+class EmulationMemo:
+    '''
+    Results of emulated calls, each with a digest of all the guest memory it
+    read (apart from code and read-only data).  Repeating a call costs one
+    batched read to check that memory is unchanged, instead of an emulation.
+    '''
+    def __init__(self, max_size=4096):
+        self.max_size = max_size
+        self.lock = threading.Lock()
+        self.entries = collections.OrderedDict() # key -> (result, reads)
 
-    def mmio_write_cb(uc, offset, size, value, data):
-        if verbose:
-            print(f">>> write {value:#x} size {size} to {offset:#x}")
-        nonlocal got_exc
-        try:
-            fake_guest.write(offset, value.to_bytes(size, 'little'))
-        except:
-            traceback.print_exc()
-            got_exc = True
+    def call(self, pc, finish, mm=None, **kwargs):
+        # finish should be a long-lived function, since it's part of the key.
+        key = (pc, finish, mm, tuple(sorted(kwargs.items())))
+        with self.lock:
+            entry = self.entries.get(key)
+        if entry is not None:
+            result, reads = entry
+            datas = guest.try_read_many([(addr, size) for (addr, size, _) in reads])
+            if all(_read_digest(data) == digest
+                   for (data, (_, _, digest)) in zip(datas, reads)):
+                with self.lock:
+                    if key in self.entries:
+                        self.entries.move_to_end(key)
+                return result
+        emu = emulate_call(pc, mm=mm, record_reads=True, **kwargs)
+        result = finish(emu)
+        immutable_ranges = emulator_pool(mm).immutable_ranges
+        reads = tuple(
+            (addr, size, _read_digest(data))
+            for (addr, size, data) in emu.reads
+            if not any(start <= addr and addr + size <= end for (start, end) in immutable_ranges)
+        )
+        with self.lock:
+            self.entries[key] = (result, reads)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+        return result
 
-    def handle_stubbed_function(sf):
-        mu.reg_write(ac.UC_ARM64_REG_X0, sf())
-        return mu.reg_read(ac.UC_ARM64_REG_LR)
+emulation_memo = EmulationMemo()
 
-    ADDR = 0
-    SIZE = 1 << 48
-    dummy_ret_addr = 0x1234
+def memoized_emulate_call(pc, finish, mm=None, **kwargs):
+    '''
+    finish(emulate_call(pc, mm=mm, **kwargs)), reusing the last result for
+    the same arguments if nothing it read has changed; see EmulationMemo.
+    '''
+    return emulation_memo.call(pc, finish, mm=mm, **kwargs)
 
-    mu.mmio_map(ADDR, SIZE, mmio_read_cb, None, mmio_write_cb, None)
-    mu.mem_protect(ADDR, SIZE, unicorn.UC_PROT_READ | unicorn.UC_PROT_WRITE | unicorn.UC_PROT_EXEC)
-    mu.reg_write(ac.UC_ARM64_REG_SP, 0x10000)
-    mu.reg_write(ac.UC_ARM64_REG_LR, dummy_ret_addr)
-    rw = RegsWrap(mu)
-    for reg, val in kwargs.items():
-        rw.set(reg, val)
-    single_step = verbose #or True
-    prev_reg_vals_raw = {}
-
-    max_time = 0.3
-    max_ss_insns = 300
-    cur_ss_insns = 0
-
-    mu.ctl_exits_enabled(True)
-    mu.ctl_set_exits([dummy_ret_addr, *stubbed_functions])
-
-    deadline = time.time() + max_time
-
-    while True:
-        if verbose:
-            print(f'pc={unslide(pc):#x}', end='')
-            for name, reg in rw.uregs.items():
-                val_raw = reg.read(mu)
-                prev = prev_reg_vals_raw.get(name)
-                if val_raw != prev:
-                    val = rw.get(name)
-                    if isinstance(val, int):
-                        val = hex(val)
-                    print(f' {name}={val}', end='')
-                    prev_reg_vals_raw[name] = val_raw
-            print()
-        # Outside of single-step mode, use timeout instead of instruction
-        # counter because instruction counter internally forces Unicorn to
-        # single-step.  Not that it really matters since jit will be slow
-        # anyway for this.  Whatever!
-        timeout = int((deadline - time.time()) * 1_000_000)
-        if timeout == 0:
-            raise Exception(f"took too long ({max_time}s)")
-        mu.emu_start(begin=pc, until=0, count=1 if single_step else 0, timeout=timeout)
-        pc = mu.reg_read(ac.UC_ARM64_REG_PC)
-        if pc == dummy_ret_addr:
-            break
-        sf = stubbed_functions.get(pc)
-        if sf is not None:
-            pc = handle_stubbed_function(sf)
-        cur_ss_insns += 1
-        if cur_ss_insns == max_ss_insns:
-            raise Exception("took too long (single-step instruction counter)")
-
-    if got_exc:
-        raise Exception('got exception while emulating, see above')
-
-    emu = Emu()
-    emu.guest = fake_guest
-    emu.regs = rw
-    return emu
+def emu_result_cstr(emu):
+    return emu.guest.read_cstr(emu.regs.x0)
 
 def guest_read_ptr(ty, addr):
     return ptr_to(ty)(addr).get()
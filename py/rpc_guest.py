@@ -53,20 +53,42 @@ class RPCConn:
             self.response_queue.put(f)
         return f.result()
 
+    def send_many_and_recv(self, datas):
+        # Send everything before waiting for anything, so the requests cost
+        # one round trip rather than one each.  If the connection goes away
+        # partway, the requests that didn't get a response get the
+        # ConnectionClosed exception in their place.
+        fs = []
+        with self.lock:
+            for data in datas:
+                f = Future()
+                self.ws.send(data)
+                self.response_queue.put(f)
+                fs.append(f)
+        ret = []
+        for f in fs:
+            try:
+                ret.append(f.result())
+            except websockets.ConnectionClosed as e:
+                ret.append(e)
+        return ret
+
     def recv_thread_func(self):
+        the_exc = None
         try:
             while True:
                 try:
                     resp = self.ws.recv()
-                except websockets.ConnectionClosedError as e:
+                except websockets.ConnectionClosed as e:
                     the_exc = e
+                    break
                 f = self.response_queue.get_nowait()
                 f.set_result(resp)
         finally:
             self.response_queue.shutdown()
             while not self.response_queue.empty():
                 f = self.response_queue.get_nowait()
-                f.set_exception(the_exc)
+                f.set_exception(the_exc or websockets.ConnectionClosed(None, None))
 
 class HoseConn:
     def __init__(self, base_url):
@@ -107,16 +129,20 @@ class RPCGuest(smmboss.Guest):
         self.rpc_resp_queue = []
 
         self.conn = None
-        self.connect(if_conn_is=None)
+        if lifeboat.get('base_url') == base_url and lifeboat.get('conn') is not None:
+            # Keep the old instance's connection; if it's dead, the first
+            # request will reconnect.
+            self.conn = lifeboat['conn']
+        else:
+            self.connect(if_conn_is=None)
         self.parse_hello(self.conn.hello)
         super().__init__()
 
     def kill(self):
-        self.ws.close()
-        self.async_loop.call_soon_threadsafe(self.kill_async)
-        #self.async_thread.join() <-- seems like websockets is broken and only cancels after quite a while, yay
+        # Called when this module is reloaded; returns the lifeboat for the
+        # new instance.
         self.executor.shutdown(wait=False)
-        return {'hose_data': self.hose_data}
+        return {'base_url': self.base_url, 'conn': self.conn}
 
     def kill_async(self):
         print('cancelling', file=sys.stderr)
@@ -162,7 +188,7 @@ class RPCGuest(smmboss.Guest):
         try:
             conn = self.conn
             resp = conn.send_and_recv(data)
-        except websockets.ConnectionClosedError:
+        except (websockets.ConnectionClosed, queue.ShutDown):
             # reconnect, unless someone else did
             self.connect(if_conn_is=conn)
             # retry
@@ -173,23 +199,152 @@ class RPCGuest(smmboss.Guest):
         assert isinstance(resp, bytes)
         return resp
 
+    def send_many_and_recv(self, datas):
+        # Like send_and_recv, but error responses are returned as RPCError
+        # objects rather than raised, and requests the connection went away
+        # before answering as the ConnectionClosed exception, so the caller
+        # can deal with them individually.
+        try:
+            conn = self.conn
+            resps = conn.send_many_and_recv(datas)
+        except (websockets.ConnectionClosed, queue.ShutDown):
+            # it was already dead
+            self.connect(if_conn_is=conn)
+            resps = self.conn.send_many_and_recv(datas)
+        ret = []
+        for resp in resps:
+            if isinstance(resp, str):
+                resp = RPCError(resp)
+            else:
+                assert isinstance(resp, (bytes, websockets.ConnectionClosed))
+            ret.append(resp)
+        return ret
+
+    # The server queues responses in a 64KiB buffer per connection, and if
+    # one doesn't fit, it answers "i'm overstuffed" and drops the connection
+    # (so the rest of a pipelined batch fails too).  So keep each read, and
+    # the responses to each batch of pipelined requests, WebSocket headers
+    # included, well under that; and if it happens anyway (e.g. other
+    # threads' requests on the same connection), retry on a new connection,
+    # giving up after a few tries in a row that get nothing through.
+    MAX_READ_SIZE = 0x8000
+    MAX_BATCH_READ_BYTES = 0x8000
+    MAX_OVERSTUFFED_RETRIES = 5
+
+    @staticmethod
+    def _response_size(body_size):
+        # as in serve.cpp's add_ws_header_size
+        return body_size + (2 if body_size < 126 else 4 if body_size < 65536 else 10)
+
+    def send_pipelined(self, reqs):
+        '''
+        Send reqs, a list of (request, most bytes the response body can be),
+        pipelined in batches the server can buffer the responses to.
+        Returns the responses, as bytes or RPCError.
+        '''
+        ret = [None] * len(reqs)
+        todo = list(range(len(reqs)))
+        failures = 0
+        while todo:
+            batches = []
+            batch_bytes = None
+            for i in todo:
+                size = self._response_size(reqs[i][1])
+                if batch_bytes is None or batch_bytes + size > self.MAX_BATCH_READ_BYTES:
+                    batches.append([])
+                    batch_bytes = 0
+                batches[-1].append(i)
+                batch_bytes += size
+            retry = []
+            for batch in batches:
+                conn = self.conn
+                resps = self.send_many_and_recv([reqs[i][0] for i in batch])
+                dropped = False
+                for i, resp in zip(batch, resps):
+                    if (isinstance(resp, websockets.ConnectionClosed) or
+                        (isinstance(resp, RPCError) and resp.args[0] == "i'm overstuffed")):
+                        retry.append(i)
+                        dropped = True
+                    else:
+                        ret[i] = resp
+                if dropped:
+                    self.connect(if_conn_is=conn)
+            if len(retry) == len(todo):
+                # nothing got through
+                failures += 1
+                if failures > self.MAX_OVERSTUFFED_RETRIES:
+                    raise RPCError(f"i'm overstuffed (gave up after {self.MAX_OVERSTUFFED_RETRIES} retries)")
+            else:
+                failures = 0
+            todo = retry
+        return ret
+
+    def try_read_many(self, ranges):
+        ranges = list(ranges)
+        # reads too big for one response go in pieces
+        pieces = [
+            (i, addr + off, min(self.MAX_READ_SIZE, size - off))
+            for (i, (addr, size)) in enumerate(ranges)
+            for off in range(0, max(size, 1), self.MAX_READ_SIZE)
+        ]
+        resps = self.send_pipelined([
+            (struct.pack('<BQQ',
+                1, # RPC_REQ_READ
+                addr,
+                size
+            ), size)
+            for (_, addr, size) in pieces
+        ])
+        ret = [b''] * len(ranges)
+        short = set()
+        for (i, _, size), resp in zip(pieces, resps):
+            if isinstance(resp, RPCError):
+                raise resp
+            assert len(resp) <= size
+            if i not in short:
+                ret[i] += resp
+                if len(resp) < size:
+                    short.add(i)
+        return ret
+
     def try_read(self, addr, size):
-        while True:
-            try:
-                resp = self.send_and_recv(struct.pack('<BQQ',
-                    1, # RPC_REQ_READ
-                    addr,
-                    size
-                ))
-            except RPCError as e:
-                if e.args[0] != "i'm overstuffed":
-                    raise
+        return self.try_read_many([(addr, size)])[0]
+
+    # How much of a string to ask for at once; longer strings take more
+    # requests.
+    CSTR_CHUNK_SIZE = 0x100
+
+    def read_cstr(self, addr):
+        return self.read_cstrs([addr])[0]
+
+    def read_cstrs(self, addrs):
+        # The server stops each read after the NUL, so most strings cost one
+        # pipelined request.
+        todo = {i: (addr, b'') for (i, addr) in enumerate(addrs)}
+        ret = [None] * len(todo)
+        while todo:
+            batch = list(todo.items())
+            resps = self.send_pipelined([
+                (struct.pack('<BQQ',
+                    6, # RPC_REQ_READ_CSTR
+                    addr + len(data),
+                    self.CSTR_CHUNK_SIZE
+                ), self.CSTR_CHUNK_SIZE)
+                for (i, (addr, data)) in batch
+            ])
+            for (i, (addr, data)), resp in zip(batch, resps):
+                if isinstance(resp, RPCError):
+                    raise resp
+                assert len(resp) <= self.CSTR_CHUNK_SIZE
+                data += resp
+                if resp.endswith(b'\0'):
+                    ret[i] = data[:-1]
+                    del todo[i]
+                elif len(resp) < self.CSTR_CHUNK_SIZE:
+                    raise Exception('only read %#x bytes of string @ %#x' % (len(data), addr))
                 else:
-                    # Too many parallel requests.  Just try again.
-                    continue
-            break
-        assert len(resp) <= size
-        return resp
+                    todo[i] = (addr, data)
+        return ret
 
     def try_write(self, addr, data):
         resp = self.send_and_recv(struct.pack('<BQ',
@@ -283,12 +438,16 @@ print('Hello', foo)
 if shell.started_shell_with == 'rpc_guest':
     import __main__
     import smmboss
-    if guest := getattr(__main__, 'guest', None):
-        lifeboat = guest.kill()
-    else:
-        lifeboat = {}
-    __main__.guest = RPCGuest(sys.argv[1], lifeboat=lifeboat)
-    __main__.mm = smmboss.MM.with_guest(__main__.guest)
+    with smmboss.maybe_profile_startup('rpc_guest startup'):
+        if guest := getattr(__main__, 'guest', None):
+            lifeboat = guest.kill()
+        else:
+            lifeboat = {}
+        __main__.guest = RPCGuest(sys.argv[1], lifeboat=lifeboat)
+        old_mm = getattr(__main__, 'mm', None)
+        __main__.mm = smmboss.MM.with_guest(__main__.guest)
+        if old_mm is not None:
+            __main__.mm.adopt_world(old_mm)
 
 if __name__ == '__main__':
     shell.main('rpc_guest')
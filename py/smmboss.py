@@ -1,7 +1,7 @@
 #!/usr/bin/env python3
 
 from guest_access import *
-import socket, struct, sys, os, time, importlib
+import socket, struct, sys, os, time, importlib, contextlib, marshal
 from threading import Lock
 from functools import cache
 from typing import Callable
@@ -12,8 +12,57 @@ def addrs_yaml_path():
 
 @cache
 def get_addrs_yaml():
+    # Parsing all of addrs.yaml is slow, so keep a marshalled copy of the
+    # result, good until addrs.yaml changes.
+    path = addrs_yaml_path()
+    st = os.stat(path)
+    key = (st.st_mtime_ns, st.st_size)
+    cache_path = Path(__file__).parent / '__pycache__' / f'addrs.yaml.{sys.implementation.cache_tag}.marshal'
+    try:
+        with open(cache_path, 'rb') as fp:
+            cached_key, data = marshal.load(fp)
+        if cached_key == key:
+            return data
+    except (OSError, ValueError, EOFError, TypeError):
+        pass
     import yaml
-    return yaml.safe_load(open(addrs_yaml_path()))
+    with open(path) as fp:
+        data = yaml.safe_load(fp)
+    try:
+        cache_path.parent.mkdir(exist_ok=True)
+        tmp_path = cache_path.with_name(f'{cache_path.name}.{os.getpid()}')
+        with open(tmp_path, 'wb') as fp:
+            marshal.dump((key, data), fp)
+        os.replace(tmp_path, cache_path)
+    except (OSError, ValueError):
+        pass
+    return data
+
+@contextlib.contextmanager
+def maybe_profile_startup(what):
+    '''
+    If $SMMBOSS_PROFILE_STARTUP is set, profile the enclosed startup code and
+    print the top entries to stderr, or if it's set to something other than
+    1, save the stats to that path.  (For the cost of imports, see
+    `python -X importtime`.)
+    '''
+    dest = os.environ.get('SMMBOSS_PROFILE_STARTUP')
+    if not dest:
+        yield
+        return
+    import cProfile, pstats
+    profile = cProfile.Profile()
+    start = time.perf_counter()
+    profile.enable()
+    try:
+        yield
+    finally:
+        profile.disable()
+        print(f'{what} took {time.perf_counter() - start:.3f}s', file=sys.stderr)
+        if dest == '1':
+            pstats.Stats(profile, stream=sys.stderr).sort_stats('cumulative').print_stats(30)
+        else:
+            profile.dump_stats(dest)
 
 @cache
 def _dotnote_addrs():
@@ -33,6 +82,7 @@ class MM:
 
     def _init(self):
         self._world = None
+        self._image_store = None
 
     @classmethod
     def with_guest(cls, guest):
@@ -51,6 +101,8 @@ class MM:
         self.main_image_info = {
             'build_id': build_id,
         }
+        # no guest, so nothing is known about where the images are
+        self.image_infos = []
         self.process_main_image_info()
         return self
 
@@ -115,6 +167,22 @@ class MM:
             return 0
         return (addr - self._slide) & 0xffffffffffffffff
 
+    def immutable_ranges(self):
+        '''(start, end) of the code and read-only data of each image, where known'''
+        return [
+            (info[f'{kind}_start'], info[f'{kind}_end'])
+            for info in self.image_infos
+            for kind in ('text', 'rodata')
+            if f'{kind}_end' in info
+        ]
+
+    @property
+    def image_store(self):
+        '''An ImageStore for our images' code and read-only data.'''
+        if self._image_store is None:
+            self._image_store = ImageStore(Path(__file__).parent / '../image_cache', self.image_infos)
+        return self._image_store
+
     def unslide_ex(self, addr):
         if addr != 0:
             for ii in self.image_infos:
@@ -138,10 +206,27 @@ class MM:
 
     @property
     def world(self):
-        if self._world is None or self._world.stale_code:
+        if self._world is None:
             self._world = self.make_world()
+        elif self._world.stale_code:
+            self._world.reload_changed()
         return self._world
 
+    def adopt_world(self, other):
+        '''
+        Take over other's world, with its caches, instead of building a new one
+        (e.g. across a reload of the guest module), if it's for the same image.
+        '''
+        world = other._world
+        if world is None or other.main_image_info != self.main_image_info:
+            return
+        world.guest = self.guest
+        world.mm = self
+        # and the things smmboss_world set up from the old MM
+        world.image_store = self.image_store if self.guest is not None else None
+        world.cstr_intern = world.CStringIntern(self, world.persistent_cache)
+        self._world = world
+
     def stubbed_functions(self) -> dict[int, Callable[[], int]]:
         return {
             self.addr.cxa_guard_acquire: lambda: 0,
@@ -1,9 +1,20 @@
 from pathlib import Path
-import smmboss, guest_access
-persistent_cache = guest_access.PersistentCache(
-    path=smmboss.addrs_yaml_path().parent / 'persistent_cache.jsonl',
-    build_id=mm.main_image_info['build_id'],
-)
+import smmboss, guest_access, math
+# When this file is re-exec'd into the same world (World.reload_changed),
+# keep the already-loaded cache.
+if not isinstance(globals().get('persistent_cache'), guest_access.PersistentCache):
+    persistent_cache = guest_access.PersistentCache(
+        path=smmboss.addrs_yaml_path().parent / 'persistent_cache',
+        build_id=mm.main_image_info['build_id'],
+    )
+if not isinstance(cstr_intern, CStringIntern):
+    # (or it's from before CStringIntern was redefined; keep its strings)
+    old_strs = cstr_intern.strs if cstr_intern is not None else {}
+    cstr_intern = CStringIntern(mm, persistent_cache)
+    cstr_intern.strs.update(old_strs)
+    del old_strs
+if mm.guest is not None:
+    image_store = mm.image_store
 
 class Point2D(GuestStruct):
     x = prop(0, f32)
@@ -77,11 +88,36 @@ class FancyString(GuestStruct):
         return repr(self.cstr)
     def as_str(self):
         return self.cstr.as_str()
+    @staticmethod
+    def as_strs(fancy_strings):
+        '''as_str() for a bunch of FancyStrings, with one batch of string reads'''
+        return GuestCString.as_strs([fs.cstr for fs in fancy_strings])
 
 class SeadListNode(GuestStruct):
     prev = prop(0, lambda: ptr_to(SeadListNode))
     next = prop(8, lambda: ptr_to(SeadListNode))
 
+    def prefetch_children(self):
+        return () # lists are walked from their SeadListImpl
+
+class _SeadListCursor(SeadListNode):
+    # A link that prefetch() has got to while walking a list.  Walking on
+    # doesn't count as going deeper; the elements do.
+    __slots__ = ('the_list', 'i')
+    _prefetch_container = True
+    _prefetch_depth_cost = 0
+    def __init__(self, addr, the_list=None, i=0):
+        super().__init__(addr)
+        self.the_list = the_list
+        self.i = i
+    def prefetch_children(self):
+        the_list = self.the_list
+        link_offset = 0 if the_list.ignore_link_offset else the_list.link_offset
+        yield the_list.elem_ty(as_addr(self.addr - link_offset))
+        next = self.next
+        if next and next != the_list and self.i + 1 < the_list.count:
+            yield _SeadListCursor(next.addr, the_list, self.i + 1)
+
 class SeadListImpl(SeadListNode):
     count = prop(0x10, u32)
     link_offset = prop(0x14, u32)
@@ -100,25 +136,94 @@ class SeadListImpl(SeadListNode):
             assert actual_count <= expected_count
         assert actual_count == expected_count
 
+    def prefetch_children(self):
+        next = self.next
+        if self.count and next and next != self:
+            yield _SeadListCursor(next.addr, self)
+
     def __getitem__(self, i):
+        # For more than the odd index, use snapshot().
         count = self.count
         if i < 0:
             i += count
         assert 0 <= i < count, (i, count)
-        it = iter(self)
+        if i < count // 2:
+            it = self.__iter__()
+        else:
+            it = self.__iter__(rev=True)
+            i = count - 1 - i
         for j in range(i):
             next(it)
         return next(it)
 
+    def snapshot(self) -> 'SeadListSnapshot':
+        '''
+        Walk the whole list once and return its elements as an indexable
+        sequence.  The walk goes from both ends at once, reading a chunk
+        around each link, since links tend to be allocated near each other.
+        '''
+        chunk_size = 0x1000
+        chunks = {}
+        def read_links(addrs):
+            wanted = {(addr + off) & ~(chunk_size - 1) for addr in addrs for off in (0, 15)}
+            wanted = sorted(chunk for chunk in wanted if chunk not in chunks)
+            chunks.update(zip(wanted, guest.try_read_many([(chunk, chunk_size) for chunk in wanted])))
+            links = []
+            for addr in addrs:
+                chunk = addr & ~(chunk_size - 1)
+                off = addr - chunk
+                data = (chunks[chunk] + chunks[(addr + 15) & ~(chunk_size - 1)])[off:off+16] \
+                       if off > chunk_size - 16 else chunks[chunk][off:off+16]
+                if len(data) != 16:
+                    data = guest.read(addr, 16)
+                links.append(struct.unpack('<QQ', data))
+            return links
+
+        count = self.count
+        head = self.addr
+        (b, f), = read_links([head])
+        fwd = []
+        bwd = []
+        while len(fwd) + len(bwd) < count:
+            remaining = count - len(fwd) - len(bwd)
+            addrs = [f] if remaining == 1 else [f, b]
+            assert head not in addrs, 'list is shorter than its count'
+            links = read_links(addrs)
+            fwd.append(f)
+            f = links[0][1]
+            if remaining > 1:
+                bwd.append(b)
+                b = links[1][0]
+        # the two walks have to meet up
+        assert f == (bwd[-1] if bwd else head), 'list is longer than its count'
+        link_offset = 0 if self.ignore_link_offset else self.link_offset
+        return SeadListSnapshot(self, [self.elem_ty(as_addr(addr - link_offset))
+                                       for addr in fwd + bwd[::-1]])
+
     def dump(self, fp, indent, **opts):
         fp.write(f'sead::List ({self.addr:#x}, count={self.count}):')
-        i = 0
         indent2 = indent + '  '
-        for item in self:
+        for i, item in enumerate(self.snapshot()):
             fp.write(f'\n{indent2}[{i}] = ')
             dump(item, fp, indent2, **opts)
             fp.write(',')
-            i += 1
+
+class SeadListSnapshot:
+    # The elements of a sead::List as of one walk; see SeadListImpl.snapshot.
+    __slots__ = ('the_list', 'elems')
+    def __init__(self, the_list, elems):
+        self.the_list = the_list
+        self.elems = tuple(elems)
+    def __len__(self):
+        return len(self.elems)
+    def __getitem__(self, i):
+        return self.elems[i]
+    def __iter__(self):
+        return iter(self.elems)
+    def __reversed__(self):
+        return reversed(self.elems)
+    def __repr__(self):
+        return f'{self.the_list!r}.snapshot() = {list(self.elems)!r}'
 
 def sead_list(_elem_ty, ignore_link_offset=False):
     _ignore_link_offset = ignore_link_offset
@@ -166,12 +271,16 @@ class StateMgr(GuestStruct):
     def cur_state_name(self):
         return self.names[self.state].as_str()
 
+    def state_names(self):
+        return FancyString.as_strs(self.names.load_items())
+
     def dump_states_inner(self):
         count = self.state_objs.count
         assert count == self.names.count
+        names = self.state_names()
         for i in range(count):
             state = self.state_objs[i]
-            info = {'id': i, 'name': self.names[i].as_str()}
+            info = {'id': i, 'name': names[i]}
             for kind in ['in', 'tick', 'out']:
                 cb = getattr(state, f'cb_{kind}')
                 func = mm.unslide(cb.resolve(state.target).addr)
@@ -199,8 +308,8 @@ class StateMgr(GuestStruct):
                 print(f'bv.define_user_symbol(Symbol(sym_type=SymbolType.FunctionSymbol, addr={addr:#x}, short_name={name!r}))')
 
     def dump_states_enum(self):
-        for i, name in enumerate(self.names):
-            print(f'    {name.as_str()} = {i},')
+        for i, name in enumerate(self.state_names()):
+            print(f'    {name} = {i},')
 
 class ObjRec(GuestStruct):
     _instance_cacheable = True
@@ -212,19 +321,78 @@ class ObjRec(GuestStruct):
     base_name = prop(0x28, FancyString)
     variation_name = prop(0x38, FancyString)
 
-    @functools.lru_cache(None)
     def get_name(self):
-        return '%s(%x)' % (self.get_name_no_idee(), self.idee)
+        return self._name
 
-    @functools.lru_cache(None)
     def get_name_no_idee(self):
-        return self.variation_name.as_str() or self.base_name.as_str()
+        return self._name_no_idee
+
+    @functools.cached_property
+    def _info(self):
+        # our entry in objrec_table(), if we're in it
+        return _objrec_infos_by_addr().get(self.addr)
+
+    @functools.cached_property
+    def _name(self):
+        info = self._info
+        idee = info['idee'] if info is not None else self.idee
+        return '%s(%x)' % (self.get_name_no_idee(), idee)
+
+    @functools.cached_property
+    def _name_no_idee(self):
+        if (info := self._info) is not None:
+            return info['variation_name'] or info['base_name']
+        # ObjRecs are static data in the main image and their names don't
+        # change, so remember them across sessions.
+        image_info, offset = mm.unslide_ex(self.addr)
+        if image_info is not mm.main_image_info:
+            return self.uncached_get_name_no_idee()
+        return persistent_cache.get('ObjRec.name_no_idee', offset,
+            compute=self.uncached_get_name_no_idee)
+
+    def uncached_get_name_no_idee(self):
+        variation_name, base_name = FancyString.as_strs([self.variation_name, self.base_name])
+        return variation_name or base_name
 
     @staticmethod
     @functools.lru_cache(None)
     def by_idee(idee):
-        objrecs_by_idee = fixed_array(ptr_to(ObjRec), 0xee)(mm.addr.idee_to_objrec)
-        return objrecs_by_idee[idee]
+        info = objrec_table()[idee]
+        return ObjRec(mm.slide(info['offset']) if info is not None else 0)
+
+def objrec_table():
+    '''
+    What doesn't change about the ObjRecs for a build, as a list indexed by
+    idee of dicts with each one's offset in the main image, idee and names
+    (or None where there's no ObjRec).  Kept in the persistent cache; the
+    first time, it's read with one batch of reads each for the pointer
+    table, the ObjRecs and their names.
+    '''
+    return persistent_cache.get('ObjRec.table', compute=uncached_objrec_table)
+
+def uncached_objrec_table():
+    ptrs = fixed_array(ptr_to(ObjRec), 0xee)(mm.addr.idee_to_objrec).load()
+    objrecs = load_many([objrec for objrec in ptrs if objrec])
+    names = FancyString.as_strs([objrec.base_name for objrec in objrecs] +
+                                [objrec.variation_name for objrec in objrecs])
+    infos = {}
+    for i, objrec in enumerate(objrecs):
+        image_info, offset = mm.unslide_ex(objrec.addr)
+        if image_info is not mm.main_image_info:
+            raise Exception(f'{objrec} is not in the main image')
+        infos[objrec.addr] = {
+            'offset': offset,
+            'idee': objrec.idee,
+            'base_name': names[i],
+            'variation_name': names[len(objrecs) + i],
+        }
+    return [infos[objrec.addr] if objrec else None for objrec in ptrs]
+
+@functools.cache
+def _objrec_infos_by_addr():
+    if 'idee_to_objrec' not in mm.yaml['addrs']:
+        return {}
+    return {mm.slide(info['offset']): info for info in objrec_table() if info is not None}
 
 class Relly(GuestStruct):
     # afaik this is what I used to call EditActorPlacementData, but I'm
@@ -272,20 +440,100 @@ class VtableForActorBase(GuestStruct):
         emu = emulate_call(self.get_name.addr, x0=0, mm=mm)
         return emu.guest.read_cstr(emu.regs.x0).decode()
 
+    @property
+    def class_info(self) -> dict:
+        # Everything python_class needs, in one persistent cache entry keyed
+        # by the unslid address; see also build_actor_class_table.
+        return persistent_cache.get('AB.class_info', mm.unslide(self.addr),
+            compute=self.uncached_class_info)
+
+    def uncached_class_info(self) -> dict:
+        return {
+            'name': self.uncached_class_name(),
+            'metaclass': mm.unslide(self.uncached_metaclass()),
+            # which of the metaclasses in addrs.yaml we're a subclass of
+            'supers': [
+                name for name in known_metaclass_names()
+                if self.uncached_is_subclass_of(getattr(mm.addr, f'metaclass_{name}'))
+            ],
+        }
+
     @functools.cached_property
     def python_class(self) -> type:
-        class_name = self.class_name
-        if class_name == 'GameEnemyTowerManager':
+        info = self.class_info
+        supers = info['supers']
+        if info['name'] == 'GameEnemyTowerManager':
             return GameEnemyTowerManager
-        elif self.is_subclass_of(mm.addr.metaclass_EnemyUber):
+        elif 'EnemyUber' in supers:
             return EnemyUber
-        elif self.is_subclass_of(mm.addr.metaclass_Actor):
+        elif 'Actor' in supers:
             return Actor
-        elif self.is_subclass_of(mm.addr.metaclass_EditActor):
+        elif 'EditActor' in supers:
             return EditActor
         else:
             return ActorBase
 
+def known_metaclass_names() -> list[str]:
+    return [key.removeprefix('metaclass_') for key in mm.yaml['addrs']
+            if key.startswith('metaclass_')]
+
+def scan_actor_vtables() -> list[VtableForActorBase]:
+    '''
+    Find the ActorBase vtables in the main image by brute force: look for
+    things shaped like vtable address points (offset-to-top of 0 just before,
+    then methods in the main image's text), then keep the ones whose first
+    three methods behave like dyn_cast, get_metaclass and get_name.
+    '''
+    import numpy as np
+    info = mm.main_image_info
+    if 'text_end' not in info or 'data_end' not in info:
+        raise Exception("don't know where the main image's segments are; pass a list of vtables instead")
+    text_start, text_end = info['text_start'], info['text_end']
+    candidates = []
+    for seg in ('rodata', 'data'):
+        start, end = info[f'{seg}_start'], info[f'{seg}_end']
+        # overlap the chunks so that address points near the end aren't missed
+        chunk_size = 0x8000
+        chunk_addrs = range(start, end, chunk_size)
+        datas = stored_try_read_many([(addr, min(chunk_size + 0x20, end - addr)) for addr in chunk_addrs])
+        for addr, data in zip(chunk_addrs, datas):
+            words = np.frombuffer(data[:len(data) & ~7], dtype='<u8')
+            in_text = (words >= text_start) & (words < text_end)
+            is_point = (words[:-4] == 0) & in_text[2:-2] & in_text[3:-1] & in_text[4:]
+            candidates += [VtableForActorBase(addr + 8 * (i + 2))
+                           for i in np.flatnonzero(is_point) if i < chunk_size // 8]
+    def check(vt):
+        try:
+            name = emulate_call(vt.get_name.addr, x0=0, mm=mm)
+            name = name.guest.read_cstr(name.regs.x0).decode()
+            if not re.fullmatch(r'[A-Za-z_][\w:]*', name):
+                return None
+            metaclass = emulate_call(vt.get_metaclass.addr, x0=0, mm=mm).regs.x0
+            if not metaclass:
+                return None
+            if not emulate_call(vt.dyn_cast.addr, x0=0, x1=metaclass, mm=mm).regs.x0:
+                return None
+            return vt
+        except Exception:
+            return None
+    return [vt for vt in guest.par_map(check, candidates) if vt is not None]
+
+def build_actor_class_table(vtables=None) -> dict[int, dict]:
+    '''
+    Work out class_info for every ActorBase vtable up front (by default,
+    those found by scan_actor_vtables), emulating in parallel, so that
+    downcasting never has to emulate anything.  Returns {unslid vtable
+    address: class_info}; the results land in the persistent cache.
+    '''
+    if vtables is None:
+        vtables = scan_actor_vtables()
+    offsets = [mm.unslide(as_addr(vt)) for vt in vtables]
+    infos = persistent_cache.get_many(
+        [('AB.class_info', offset) for offset in offsets],
+        compute=lambda key: VtableForActorBase(mm.slide(key[1])).uncached_class_info(),
+        par_map=guest.par_map)
+    return dict(zip(offsets, infos))
+
 class ActorBase(GuestStruct):
     vtable = prop(0, ptr_to(VtableForActorBase))
     idbits = prop(0x30, u64)
@@ -341,8 +589,8 @@ class GameEnemyTowerManager(Actor):
     entries = prop(0x400, ptr_array(GameEnemyTowerManager_Entry))
 
     def members(self) -> list[ActorBase]:
-        world = self.world
-        return list(guest.par_map(lambda entry: world.actor_with_idbits(entry.idbits), self.entries))
+        entries = load_many(list(self.entries.load_items()))
+        return self.world.actors_with_idbits([entry.idbits for entry in entries])
 
 class ScolNode(GuestStruct):
     node = prop(0, SeadListNode)
@@ -625,13 +873,34 @@ class BgCollisionGrid(GuestStruct, GuestArray):
             for i in range(self.count):
                 yield ((i % width) - base_x, (i // width) - base_y, self[i])
 
+    def list_counts(self, items=None):
+        '''
+        The counts of every square's three lists, as a (count, 3) numpy array,
+        from one read of the whole grid (or from items, a local view of it).
+        '''
+        import numpy as np
+        if items is None:
+            items = self.load_items()
+        squares = items.as_array()
+        return np.stack([squares[name]['count'] for name in ('list0', 'list1', 'list2')], axis=1)
+
+    def nonempty_coords(self, items=None):
+        '''(index, x, y) arrays for the nonempty squares'''
+        import numpy as np
+        idxs = np.flatnonzero(self.list_counts(items).any(axis=1))
+        (x_lo, _), (y_lo, _) = self.coord_range()
+        width = self.size().w
+        return (idxs, idxs % width + x_lo, idxs // width + y_lo)
+
     def nonempty_squares(self):
-        for (x, y, square) in self.squares():
-            if square.any_nonempty() != 0:
-                yield (x, y, square)
+        # Most squares are empty, so find the nonempty ones with numpy rather
+        # than going through every square.
+        items = self.load_items()
+        for i, x, y in zip(*self.nonempty_coords(items)):
+            yield (int(x), int(y), items[int(i)])
 
     def squares_containing_collider(self, collider):
-        for (x, y, square) in self.squares():
+        for (x, y, square) in self.nonempty_squares():
             if square.contains_collider(collider) != 0:
                 yield (x, y, square)
 
@@ -703,12 +972,22 @@ class Tiler2Grid(GuestStruct, GuestArray):
         return ((i % width, i // width, self[i])
                 for i in range(self.count))
 
+    def as_array(self, items=None):
+        '''
+        The squares as a (height, width) numpy array with fields what_to_draw,
+        field_2 and field_3, from one read (or from items, a local view).
+        '''
+        if items is None:
+            items = self.load_items()
+        return items.as_array().reshape(self.height, self.width)
+
     def nonempty_squares(self):
-        with guest:
-            self.cache_all()
-            return [(x, y, square)
-                    for (x, y, square) in self._squares()
-                    if square.what_to_draw != 0]
+        import numpy as np
+        items = self.load_items()
+        ys, xs = np.nonzero(self.as_array(items)['what_to_draw'])
+        width = self.width
+        return [(int(x), int(y), items[int(y) * width + int(x)])
+                for (y, x) in zip(ys, xs)]
 
     def square(self, x, y):
         assert 0 <= x < self.width
@@ -725,7 +1004,7 @@ class Tiler2(GuestStruct):
     grid1 = prop(0x08, Tiler2Grid)
     grid2 = prop(0x18, Tiler2Grid)
     grid3 = prop(0x28, Tiler2Grid)
-    tiles = prop(0x48, TileArray)
+    tiles = prop(0x48, TileArray) # tiles.as_array() for all of them at once
     sparkle = prop(0x60, ptr_to(SparkleTableOuter))
 
 class HitboxParams(GuestStruct):
@@ -784,6 +1063,44 @@ class AreaSystem(GuestStruct):
 class Flower(GuestStruct):
     elmd_tree_outer = prop(0x18, lambda: ptr_to(ELMDTreeOuter))
 
+class IdbitsTable:
+    '''
+    A World's idbits_hash as of one read, for resolving lots of idbits at
+    once.  The headers of the actors looked up are read in batches and kept,
+    so each actor's vtable and idbits are read at most once per snapshot;
+    downcasting goes through the (cached) VtableForActorBase.python_class.
+    '''
+    default_max_age = 1 / 60 # about a frame
+
+    def __init__(self, world):
+        self.world = world
+        self.slots = world.idbits_hash.load().as_array()
+        self.lock = threading.Lock()
+        self.headers = {} # slot -> local view of the actor's header
+
+    def actors(self, idbits_list) -> list[ActorBase]:
+        idbits_list = list(idbits_list)
+        slots = [idbits >> 32 for idbits in idbits_list]
+        with self.lock:
+            missing = sorted({slot for slot in slots if slot not in self.headers})
+        if missing:
+            for slot in missing:
+                assert 0 <= slot < len(self.slots), (slot, len(self.slots))
+            actors = [ActorBase(int(self.slots[slot])) for slot in missing]
+            datas = guest.try_read_many([(actor.addr, ActorBase.idbits.offset + 8) for actor in actors])
+            with self.lock:
+                for slot, actor, data in zip(missing, actors, datas):
+                    self.headers[slot] = actor.local(data)
+        ret = []
+        for idbits, slot in zip(idbits_list, slots):
+            header = self.headers[slot]
+            assert header.idbits == idbits, (hex(header.idbits), hex(idbits))
+            ret.append(header.vtable.python_class(header.addr))
+        return ret
+
+_idbits_tables = {} # World addr -> (time, IdbitsTable)
+_idbits_tables_lock = threading.Lock()
+
 class World(GuestStruct):
     name = prop(8, FancyString, include_in_repr=True)
     id = prop(0x20, u32)
@@ -792,9 +1109,25 @@ class World(GuestStruct):
     area_sys = prop(0x140, ptr_to(AreaSystem)) # was 0x130
 
     def actor_with_idbits(self, idbits) -> ActorBase:
-        ret = self.idbits_hash[idbits >> 32]
-        assert ret.idbits == idbits, (hex(ret.idbits), hex(idbits))
-        return ret.downcast()
+        return self.actors_with_idbits([idbits])[0]
+
+    def actors_with_idbits(self, idbits_list, max_age=IdbitsTable.default_max_age) -> list[ActorBase]:
+        return self.idbits_table(max_age).actors(idbits_list)
+
+    def idbits_table(self, max_age=IdbitsTable.default_max_age) -> 'IdbitsTable':
+        '''
+        A snapshot of idbits_hash, shared by lookups in this world for up to
+        max_age seconds.
+        '''
+        now = time.monotonic()
+        with _idbits_tables_lock:
+            cached = _idbits_tables.get(self.addr)
+        if cached is not None and now - cached[0] <= max_age:
+            return cached[1]
+        table = IdbitsTable(self)
+        with _idbits_tables_lock:
+            _idbits_tables[self.addr] = (now, table)
+        return table
 
 class ActorMgr(GuestStruct):
     @staticmethod
@@ -809,6 +1142,272 @@ class ActorMgr(GuestStruct):
     def get_all_actors(self):
         return list(guest.par_map(ActorBase.downcast, self.get_all_actors_nocast()))
 
+    def snapshot_table(self) -> 'ActorTable':
+        return ActorTable(self.get_all_actors_nocast())
+
+class ActorTable:
+    '''
+    Columnar snapshot of a set of actors, one row each, as NumPy arrays:
+    addr, idbits, idee, name, cls (the downcast class), loc and houvelo
+    (n×3), angle, gravity, world, and relly (n×2, the Relly x/y of
+    EditActors).  Rows without a field have NaN, or -1 for idee; angle (a
+    u32 in the game) is stored as float64 so that it can be NaN too.
+
+    Building it takes one batch of reads for the actors, one for their
+    ObjRecs and one for the Rellys; refresh() re-reads just the positions.
+    '''
+    _pos_start = Actor.loc.offset
+    _pos_size = Actor.houvelo.offset + 12 - _pos_start
+
+    def __init__(self, actors):
+        import numpy as np
+        actors = [actor for actor in actors if actor]
+        n = len(actors)
+        read_size = max(static_sizeof(Actor), static_sizeof(EditActor))
+        views = []
+        for actor, data in zip(actors, guest.try_read_many(
+                (actor.addr, read_size) for actor in actors)):
+            view = ActorBase(actor.addr).local(data)
+            views.append(view.cast(view.vtable.python_class))
+        self.views = views
+
+        self.addr = np.array([view.addr for view in views], dtype=np.uint64)
+        self.idbits = np.array([view.idbits for view in views], dtype=np.uint64)
+        self.world = np.array([view.world.addr for view in views], dtype=np.uint64)
+        self.cls = np.array([type(view) for view in views], dtype=object)
+
+        objrecs = {}
+        for view in views:
+            if (objrec := view.objrec):
+                objrecs[objrec.addr] = objrec
+        objrecs = {objrec.addr: objrec for objrec in load_many(objrecs.values())}
+        self.idee = np.array([objrecs[view.objrec.addr].idee if view.objrec else -1
+                              for view in views], dtype=np.int32)
+        self.name = np.array([objrecs[view.objrec.addr].get_name_no_idee() if view.objrec else None
+                              for view in views], dtype=object)
+
+        self.angle = np.full(n, np.nan, dtype=np.float64)
+        self.gravity = np.full(n, np.nan, dtype=np.float32)
+        self.loc = np.full((n, 3), np.nan, dtype=np.float32)
+        self.houvelo = np.full((n, 3), np.nan, dtype=np.float32)
+        self.relly = np.full((n, 2), np.nan, dtype=np.float32)
+        self._actor_rows = [i for (i, view) in enumerate(views) if isinstance(view, Actor)]
+        for i in self._actor_rows:
+            view = views[i]
+            self.angle[i] = view.angle
+            self.gravity[i] = view.gravity
+        self._edit_rows = []
+        self._rellys = []
+        for i, view in enumerate(views):
+            if isinstance(view, EditActor) and (relly := view.relly):
+                self._edit_rows.append(i)
+                self._rellys.append(relly)
+        self._read_positions(views)
+
+    def refresh(self):
+        '''Re-read loc, houvelo and relly, with one batch of reads.'''
+        self._read_positions()
+
+    def _read_positions(self, views=None):
+        import numpy as np
+        ranges = []
+        for i in self._actor_rows:
+            ranges.append((int(self.addr[i]) + self._pos_start, self._pos_size))
+        for relly in self._rellys:
+            ranges.append((relly.addr + Relly.x.offset, 8))
+        if views is not None:
+            # still have the actors' positions from the initial read
+            start, end = self._pos_start, self._pos_start + self._pos_size
+            datas = [bytes(views[i]._local[0][start:end]) for i in self._actor_rows]
+            datas += guest.try_read_many(ranges[len(datas):])
+        else:
+            datas = guest.try_read_many(ranges)
+        for i, data in zip(self._actor_rows, datas):
+            if len(data) == self._pos_size:
+                pos = np.frombuffer(data, dtype='<f4')
+                self.loc[i] = pos[0:3]
+                self.houvelo[i] = pos[3:6]
+            else:
+                self.loc[i] = self.houvelo[i] = np.nan
+        for i, data in zip(self._edit_rows, datas[len(self._actor_rows):]):
+            self.relly[i] = np.frombuffer(data, dtype='<f4') if len(data) == 8 else np.nan
+
+    def __len__(self):
+        return len(self.views)
+
+    def __getitem__(self, column):
+        return getattr(self, column)
+
+    columns = ('addr', 'idbits', 'idee', 'name', 'cls', 'loc', 'houvelo', 'angle',
+               'gravity', 'world', 'relly')
+
+    def actors(self) -> list[ActorBase]:
+        return [type(view)(view.addr) for view in self.views]
+
+    def __repr__(self):
+        return f'<ActorTable: {len(self)} actors>'
+
+class Query:
+    '''
+    A query over actors that reads everything it needs in a few batches
+    rather than a few reads per actor, e.g.
+
+        query(Actor).where(name='Kuribo', x=(0, 500)).select('loc', 'houvelo')
+
+    `name` is matched against ObjRec.get_name_no_idee().  `x` and `y` are
+    short for loc.x and loc.y, and as in find_ents, a plain number matches
+    anything within 4 of it.  Any other filter names a field (dotted paths
+    allowed) and takes a value, a (lo, hi) range or a predicate.  Actors that
+    don't have a filtered field don't match.
+    '''
+    _aliases = {'x': 'loc.x', 'y': 'loc.y'}
+
+    def __init__(self, cls=ActorBase, actors=None, filters=()):
+        self.cls = cls
+        # None means all actors
+        self.source = actors
+        self.filters = tuple(filters)
+
+    def where(self, **filters):
+        return Query(self.cls, self.source, self.filters + tuple(filters.items()))
+
+    def select(self, *fields):
+        return QueryResult(self.views(fields), fields)
+
+    def __iter__(self):
+        return iter(self.views())
+
+    def actors(self) -> list[ActorBase]:
+        '''The matching actors as ordinary (downcast, not local) objects.'''
+        return [type(view)(view.addr) for view in self.views()]
+
+    def views(self, fields=()) -> list[ActorBase]:
+        '''
+        The matching actors, downcast, as local views (see GuestPtr.load())
+        covering the filtered and selected fields.
+        '''
+        actors = self.source
+        if actors is None:
+            actors = ActorMgr.get().get_all_actors_nocast()
+        # 1. headers, for the vtable (which gives the class) and the objrec
+        heads = load_many(ActorBase(actor.addr) for actor in actors if actor)
+        # Work out the classes of all the vtables at once, emulating any that
+        # aren't in the persistent cache in parallel, rather than one actor at
+        # a time.
+        # (python_class is a cached_property, so skip the ones already known)
+        build_actor_class_table({vtable for head in heads
+                                 if 'python_class' not in (vtable := head.vtable).__dict__})
+        rows = []
+        for head in heads:
+            ty = head.vtable.python_class
+            if issubclass(ty, self.cls):
+                rows.append(make_ptr(ty, head.addr, head._local))
+        field_filters = []
+        for key, filt in self.filters:
+            if key == 'name':
+                rows = [row for row in rows
+                        if _query_matches(filt, row.objrec.get_name_no_idee())]
+            else:
+                field_filters.append((self._aliases.get(key, key), filt, key in self._aliases))
+        # 2. one span per actor covering all the fields we need
+        paths = tuple(path for (path, _, _) in field_filters) + tuple(fields)
+        head_size = static_sizeof(ActorBase)
+        spans = [_query_span(type(row), paths, head_size) for row in rows]
+        datas = guest.try_read_many([(row.addr, size) for (row, size) in zip(rows, spans)
+                                     if size > head_size])
+        datas = iter(datas)
+        views = []
+        for row, size in zip(rows, spans):
+            if size > head_size:
+                row = row.local(next(datas))
+            for path, filt, near in field_filters:
+                actual = _query_resolve(row, path)
+                if actual is _missing or not _query_matches(filt, actual, near):
+                    break
+            else:
+                views.append(row)
+        return views
+
+def query(cls=ActorBase, actors=None) -> Query:
+    return Query(cls, actors)
+
+class QueryResult:
+    '''
+    Rows from Query.select(): iterate or index by number for the local views,
+    or index by field for a NumPy column (structs become rows of their
+    fields, pointers become addresses).
+    '''
+    def __init__(self, views, fields):
+        self.views = views
+        self.fields = fields
+
+    def __len__(self):
+        return len(self.views)
+
+    def __iter__(self):
+        return iter(self.views)
+
+    def __getitem__(self, key):
+        if isinstance(key, str):
+            return self.column(key)
+        return self.views[key]
+
+    def column(self, field):
+        import numpy as np
+        values = [_query_value(_query_resolve(view, field)) for view in self.views]
+        if any(value is _missing for value in values):
+            return np.array([None if value is _missing else value for value in values],
+                            dtype=object)
+        return np.array(values)
+
+    def columns(self) -> dict:
+        return {field: self.column(field) for field in ('addr',) + tuple(self.fields)}
+
+    def __repr__(self):
+        return f'<QueryResult: {len(self.views)} rows of {self.fields}>'
+
+_missing = object()
+
+def _query_resolve(view, path):
+    if path == 'name':
+        return view.objrec.get_name_no_idee()
+    val = view
+    for part in path.split('.'):
+        val = getattr(val, part, _missing)
+        if val is _missing:
+            break
+    return val
+
+def _query_value(val):
+    if isinstance(val, GuestPtr) and val._local is not None:
+        if isinstance(val, GuestArray):
+            return tuple(_query_value(item) for item in val)
+        if isinstance(val, GuestStruct):
+            return tuple(_query_value(getattr(val, key)) for (key, _) in val._properties())
+    if isinstance(val, GuestPtr):
+        return val.addr
+    return val
+
+def _query_matches(filt, actual, near=False):
+    if callable(filt):
+        return filt(actual)
+    if isinstance(filt, tuple):
+        lo, hi = filt
+        return lo <= actual <= hi
+    if near and isinstance(filt, (int, float)):
+        return abs(actual - filt) < 4
+    return actual == filt
+
+@functools.cache
+def _query_span(ty, paths, min_size):
+    # How much of a ty to read to cover the first component of each path.
+    size = min_size
+    for path in paths:
+        prop = getattr(ty, path.split('.')[0], None)
+        if isinstance(prop, MyProperty):
+            size = max(size, prop.offset + (static_sizeof(prop.ptr_cls) or 0))
+    return size
+
 class OtherTimerRelated(GuestStruct):
     @staticmethod
     def get():
@@ -878,8 +1477,7 @@ class BgUnitGroupTypeSpecific(GuestStruct):
     vt = prop(0, ptr_to(VtableForBgUnitGroupTypeSpecific))
     @functools.cached_property
     def name(self):
-        emu = emulate_call(self.vt.get_name.addr, x0=self.addr, mm=mm)
-        return emu.guest.read_cstr(emu.regs.x0)
+        return memoized_emulate_call(self.vt.get_name.addr, emu_result_cstr, x0=self.addr, mm=mm)
 
 class BgUnitGroup(GuestStruct):
     node1 = prop(0x20, SeadListNode)
@@ -959,11 +1557,59 @@ class ELMDTree(GuestStruct):
         super().dump(fp, indent, **opts)
         indent2 = indent + '  '
         fp.write(f'\n{indent2}all nodes:')
-        for node in self:
-            fp.write(f'\n{indent2}')
-            dump(node, fp, indent2, **opts)
+        # The names and entries with a batch of reads each, rather than node
+        # by node as they're dumped.
+        nodes = self.nodes()
+        names = self.node_names(nodes)
+        contents = iter(load_many([node.content for node in nodes if node.content]))
+        contents = [next(contents) if node.content else node.content for node in nodes]
+        with contextlib.ExitStack() as stack:
+            if hasattr(guest, 'cache_regions'):
+                # and what the entries point to, a level at a time
+                stack.enter_context(guest)
+                prefetch([content for content in contents if content], depth=3)
+            for node, name, content in zip(nodes, names, contents):
+                fp.write(f'\n{indent2}{name!r} (node {node.addr:#x}): ')
+                dump(content, fp, indent2, **opts)
     def __iter__(self):
-        return iter(self.root)
+        # remote nodes, as from walking the tree, but found a level at a time
+        return (ELMDTreeNode(node.addr) for node in self.nodes())
+
+    def node_names(self, nodes=None):
+        '''the names of nodes (default: all of them), with one batch of string reads'''
+        if nodes is None:
+            nodes = self.nodes()
+        return FancyString.as_strs([node.name for node in nodes])
+
+    def nodes(self):
+        '''
+        Local views of all the nodes, in the same order as walking down from
+        the root (preorder), read a level of the tree at a time: one batch of
+        reads per depth rather than a round trip per node.
+        '''
+        root = self.root
+        if not root:
+            return []
+        children = {}
+        level = [root]
+        while level:
+            next_level = []
+            for node in load_many(level):
+                # (a garbage link back up the tree is dropped, not followed)
+                kids = [kid for kid in (node.left, node.right)
+                        if kid and kid.addr not in children]
+                for kid in kids:
+                    children[kid.addr] = None
+                next_level += kids
+                children[node.addr] = (node, kids)
+            level = next_level
+        ret = []
+        stack = [root.addr]
+        while stack:
+            node, kids = children[stack.pop()]
+            ret.append(node)
+            stack += [kid.addr for kid in reversed(kids)]
+        return ret
 
 class ELMDTreeOuter(GuestStruct):
     tree = prop(0x20, ELMDTree)
@@ -985,9 +1631,12 @@ def print_exported_types():
 
 @commandlike
 def print_idees():
-    for idee in range(0xee):
+    for idee, info in enumerate(objrec_table()):
         objrec = ObjRec.by_idee(idee)
-        print(f'{idee:x} -> {objrec.base_name},{objrec.variation_name} {objrec.get_name()} or={objrec}')
+        if info is None:
+            print(f'{idee:x} -> or={objrec}')
+            continue
+        print(f"{idee:x} -> {info['base_name']!r},{info['variation_name']!r} {objrec.get_name()} or={objrec}")
 
 def print_one_ent(yatsu):
     name = yatsu.objrec.get_name()
@@ -1003,34 +1652,10 @@ def print_one_ent(yatsu):
 def print_ent():
     list(guest.par_map(print_one_ent, ActorMgr.get().get_all_actors_nocast()))
 
-def match_xy_filter(filt, yatsu, actual_f):
-    if filt is None:
-        return True
-    if not isinstance(yatsu, Actor):
-        return False
-    actual = actual_f()
-    if isinstance(filt, (int, float)):
-        return abs(actual - filt) < 4
-    if callable(filt):
-        return filt(actual)
-    raise ValueError(filt)
-
 def find_ents(name=None, x=None, y=None):
-    def filter_ent(yatsu):
-        yatsu = yatsu.downcast()
-        if name is not None:
-            if yatsu.objrec.get_name_no_idee() != name:
-                return None
-        if not match_xy_filter(x, yatsu, lambda: yatsu.loc.x):
-            return None
-        if not match_xy_filter(y, yatsu, lambda: yatsu.loc.y):
-            return None
-        return yatsu
-    return [
-        yatsu
-        for yatsu in guest.par_map(filter_ent, ActorMgr.get().get_all_actors())
-        if yatsu is not None
-    ]
+    filters = {key: filt for (key, filt) in [('name', name), ('x', x), ('y', y)]
+               if filt is not None}
+    return query().where(**filters).actors()
 
 def find_ent(*args, **kwargs):
     ents = find_ents(*args, **kwargs)
@@ -1044,12 +1669,14 @@ def print_timer():
 
 @commandlike
 def print_block_kind_info():
-    bkia = block_kind_info_array()
-    for i, bki in enumerate(bkia):
-        print(f'0x{i:02}: bits=0x{bki.bits:8} {bki.name}')
+    bkia = block_kind_info_array().load()
+    names = GuestCString.as_strs([bki.name for bki in bkia])
+    for i, (bki, name) in enumerate(zip(bkia, names)):
+        print(f'0x{i:02}: bits=0x{bki.bits:8} {name!r}')
 
 def _print_collider(collider):
     print(f'  {collider}')
+    collider = collider.load()
     actor = collider.actor
     block_owner = collider.block_owner
     if actor:
@@ -1057,7 +1684,7 @@ def _print_collider(collider):
     if block_owner:
         print(f'    block_owner:{block_owner.addr:#x}')
     for kind in ('cur', 'old'):
-        pos = getattr(collider, f'ext_pos_{kind}')
+        pos = getattr(collider, f'ext_pos_{kind}').load()
         int_off = getattr(collider, f'int_off_{kind}')
         int_aoff = getattr(collider, f'int_aoff_{kind}')
         int_boff = getattr(collider, f'int_boff_{kind}')
@@ -1066,17 +1693,18 @@ def _print_collider(collider):
         width, height = bbox.size()
         print(f'           bbox: x:{bbox.min.x}-{bbox.max.x} y:{bbox.min.y}-{bbox.max.y} size:{width},{height}')
         segments = getattr(collider, f'segments_{kind}')
-        for i, seg in enumerate(segments):
+        for i, seg in enumerate(segments.load_items()):
             print(f'           segments[{i}]: x:{seg.rel_pos_1.x:5} - {seg.rel_pos_2.x:5} y:{seg.rel_pos_1.y:5} - {seg.rel_pos_2.y:5} which={seg.which_side} angle={seg.angle:#x}')
     bbox = collider.bbox_both
     width, height = bbox.size()
     print(f'    bbox_both: x:{bbox.min.x}-{bbox.max.x} y:{bbox.min.y}-{bbox.max.y} size:{width},{height}')
     print(f'    ext_unk:   {collider.ext_unk.get():#08x}        bm:{collider.some_bitmask:#x} f:{collider.flags_270:#x}')
-    ext_size = ' '.join(str(collider.ext_size[i]) for i in range(4))
+    ext_size = collider.ext_size.load()
+    ext_size = ' '.join(str(ext_size[i]) for i in range(4))
     print(f'    ext_size: {ext_size}   info:0x{collider.base_block_info:8x}')
     for i, scol_list in enumerate(collider.ridden_by_scol_lists):
         if scol_list.count != 0:
-            print(f'    ridden_by_scol_lists[{i}] = {list(scol_list)}')
+            print(f'    ridden_by_scol_lists[{i}] = {list(scol_list.snapshot())}')
 
 @commandlike
 def print_bg():
@@ -1096,7 +1724,7 @@ def print_bgcs():
 @commandlike
 def print_grid():
     seen = set()
-    for x, y, square in ActorMgr.get().cur_world.area_sys.bg_collision_system.grid.squares():
+    for x, y, square in ActorMgr.get().cur_world.area_sys.bg_collision_system.grid.nonempty_squares():
         for i, slist in enumerate([square.list0, square.list1, square.list2]):
             for entry in slist:
                 collider = entry.item.collider
@@ -1116,7 +1744,7 @@ def collider_sources():
         'bgcs1': {entry.owner for entry in bgcs.colliders1},
         'bgcs2': {entry.owner for entry in bgcs.colliders2},
         'grid': {entry.item.collider
-                    for x, y, square in bgcs.grid.squares()
+                    for x, y, square in bgcs.grid.nonempty_squares()
                     for slist in [square.list0, square.list1, square.list2]
                     for entry in slist},
     }
@@ -1124,6 +1752,324 @@ def collider_sources():
 def all_colliders_from(sources):
     return sorted(set().union(*sources.values()))
 
+class ColliderIndex:
+    '''
+    A uniform grid over colliders' bounding boxes (bbox_both, which covers
+    the current and old positions), for region queries that don't read every
+    collider each time.  Everything is in native units, 16 per block.  The
+    index is a snapshot: call update() with colliders that changed (or
+    appeared) and remove() with ones that went away.
+    '''
+    BLOCK = 16.0
+    # colliders spanning more cells than this go in a list that every query
+    # checks, rather than in the grid
+    MAX_CELLS = 1024
+
+    def __init__(self, colliders=None, cell_size=64.0):
+        self.cell_size = cell_size
+        self.entries = {} # Collider -> dict of bbox_cur, bbox_both, pos, segments
+        self.cells = collections.defaultdict(set)
+        self.big = set()
+        # covers every bbox_both that's been indexed (it doesn't shrink)
+        self.extent = None
+        if colliders is None:
+            colliders = all_colliders_from(collider_sources())
+        self.update(colliders)
+
+    def _cell_range(self, min_x, min_y, max_x, max_y):
+        cs = self.cell_size
+        return (range(math.floor(min_x / cs), math.floor(max_x / cs) + 1),
+                range(math.floor(min_y / cs), math.floor(max_y / cs) + 1))
+
+    def _cells_of(self, bbox):
+        xs, ys = self._cell_range(*bbox)
+        if len(xs) * len(ys) > self.MAX_CELLS:
+            return None
+        return [(cx, cy) for cx in xs for cy in ys]
+
+    @staticmethod
+    def _rect(rect):
+        return (rect.min.x, rect.min.y, rect.max.x, rect.max.y)
+
+    def _read(self, colliders):
+        # one batch for the colliders themselves, one for what they point to
+        colliders = load_many(colliders)
+        ranges = []
+        for c in colliders:
+            ranges.append((c.ext_pos_cur.addr, Point2D.sizeof_star))
+            segs = c.segments_cur
+            ranges.append((segs.base.addr, segs.count * ColliderSegment.sizeof_star))
+        datas = guest.try_read_many(ranges)
+        entries = {}
+        for i, c in enumerate(colliders):
+            pos = None
+            if c.ext_pos_cur:
+                pos = c.ext_pos_cur.local(datas[2*i]).xy()
+            segments = []
+            segs = c.segments_cur
+            if pos is not None and segs.count:
+                items = GuestArray(segs.base.addr, ColliderSegment, segs.count).local(datas[2*i+1])
+                for seg in items:
+                    # relative to ext_pos_cur
+                    segments.append((pos[0] + seg.rel_pos_1.x, pos[1] + seg.rel_pos_1.y,
+                                     pos[0] + seg.rel_pos_2.x, pos[1] + seg.rel_pos_2.y))
+            entries[Collider(c.addr)] = {
+                'bbox_cur': self._rect(c.bbox_cur),
+                'bbox_both': self._rect(c.bbox_both),
+                'pos': pos,
+                'segments': segments,
+            }
+        return entries
+
+    def update(self, colliders):
+        '''(Re-)read colliders and re-file them in the grid.'''
+        colliders = list(colliders)
+        self.remove(colliders)
+        for collider, entry in self._read(colliders).items():
+            self.entries[collider] = entry
+            bbox = entry['bbox_both']
+            if self.extent is None:
+                self.extent = bbox
+            else:
+                self.extent = (min(self.extent[0], bbox[0]), min(self.extent[1], bbox[1]),
+                               max(self.extent[2], bbox[2]), max(self.extent[3], bbox[3]))
+            cells = self._cells_of(bbox)
+            if cells is None:
+                self.big.add(collider)
+            else:
+                for cell in cells:
+                    self.cells[cell].add(collider)
+
+    def remove(self, colliders):
+        for collider in colliders:
+            entry = self.entries.pop(collider, None)
+            if entry is None:
+                continue
+            cells = self._cells_of(entry['bbox_both'])
+            if cells is None:
+                self.big.discard(collider)
+            else:
+                for cell in cells:
+                    cell_set = self.cells[cell]
+                    cell_set.discard(collider)
+                    if not cell_set:
+                        del self.cells[cell]
+
+    def _candidates(self, min_x, min_y, max_x, max_y):
+        out = set(self.big)
+        xs, ys = self._cell_range(min_x, min_y, max_x, max_y)
+        if len(xs) * len(ys) > len(self.cells):
+            for (cx, cy), cell_set in self.cells.items():
+                if cx in xs and cy in ys:
+                    out |= cell_set
+        else:
+            for cx in xs:
+                for cy in ys:
+                    out |= self.cells.get((cx, cy), set())
+        return out
+
+    def intersecting(self, min_x, min_y, max_x, max_y) -> list:
+        '''colliders whose bbox_cur overlaps the given rectangle'''
+        return sorted(
+            collider for collider in self._candidates(min_x, min_y, max_x, max_y)
+            if _rects_overlap(self.entries[collider]['bbox_cur'], (min_x, min_y, max_x, max_y))
+        )
+
+    def distance(self, collider, x, y) -> float:
+        '''
+        Distance from (x, y) to the collider's segments if it has any,
+        otherwise to its bbox_cur (0 if inside).
+        '''
+        entry = self.entries[collider]
+        if entry['segments']:
+            return min(_point_segment_distance(x, y, *seg) for seg in entry['segments'])
+        min_x, min_y, max_x, max_y = entry['bbox_cur']
+        return math.hypot(max(min_x - x, 0, x - max_x), max(min_y - y, 0, y - max_y))
+
+    def within(self, x, y, radius) -> list:
+        '''(distance, collider) for colliders within radius of (x, y), nearest first'''
+        found = []
+        for collider in self._candidates(x - radius, y - radius, x + radius, y + radius):
+            dist = self.distance(collider, x, y)
+            if dist <= radius:
+                found.append((dist, collider))
+        return sorted(found)
+
+    def nearest(self, x, y):
+        '''(distance, collider) for the collider nearest (x, y), or None'''
+        if not self.entries:
+            return None
+        min_x, min_y, max_x, max_y = self.extent
+        farthest = math.hypot(max(x - min_x, max_x - x), max(y - min_y, max_y - y))
+        radius = self.cell_size
+        while radius <= 2 * farthest:
+            found = self.within(x, y, radius)
+            if found:
+                return found[0]
+            radius *= 2
+        # only if some collider's segments stick out of its bbox
+        return min((self.distance(collider, x, y), collider) for collider in self.entries)
+
+    def near_player(self, blocks) -> list:
+        '''(distance, collider) for colliders within that many blocks of the player'''
+        players = query(Player).actors()
+        if not players:
+            raise Exception('no player')
+        x, y = players[0].loc.xy()
+        return self.within(x, y, blocks * self.BLOCK)
+
+def _rects_overlap(a, b):
+    return a[0] <= b[2] and b[0] <= a[2] and a[1] <= b[3] and b[1] <= a[3]
+
+def _point_segment_distance(x, y, x1, y1, x2, y2):
+    dx, dy = x2 - x1, y2 - y1
+    length_sq = dx * dx + dy * dy
+    t = 0.0 if length_sq == 0 else max(0.0, min(1.0, ((x - x1) * dx + (y - y1) * dy) / length_sq))
+    return math.hypot(x - (x1 + t * dx), y - (y1 + t * dy))
+
+class ReportedCollider:
+    # A normal collider as last reported over the hose.
+    __slots__ = ('collider', 'ext_pos_cur', 'ext_pos_old', 'segments_cur', 'segments_old', 'world_id')
+
+class ReportedScol:
+    __slots__ = ('scol', 'ext_pos_cur', 'ext_pos_old', 'world_id')
+
+class ColliderRegistry:
+    '''
+    The live colliders, kept up to date from the events the game sends over
+    the hose with SEND_COLL_STUFF, rather than by walking the level:
+    normco+/normco- as normal colliders come and go, normco* for each one
+    after an allcols (a full resync), and scolcol/scolco~ for scol colliders
+    (the latter meaning unchanged since last sent).  Each entry keeps the
+    reported bytes, as local views.  After an overrun, when events have been
+    lost, it asks for a resync with SEND_ALL_COLLS.
+
+    take_changes() returns what changed since it was last called, e.g. for
+    ColliderIndex.update() and remove().
+    '''
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.colliders = {} # addr -> ReportedCollider
+        self.scols = {} # addr -> ReportedScol
+        self.changed = set() # collider addrs added or updated
+        self.removed = set()
+        # during a resync, the colliders not yet reported again
+        self.unconfirmed = None
+        self.resyncs = 0
+        self.hose_conn = None
+        self.thread = None
+
+    def start(self):
+        self.hose_conn = guest.connect_hose()
+        self.thread = threading.Thread(target=self._thread_func, args=(self.hose_conn,), daemon=True)
+        self.thread.start()
+        guest.set_flags(send_coll_stuff=True)
+        self.resync()
+
+    def stop(self):
+        if self.hose_conn is not None:
+            # stop the game from doing the extra work for nobody
+            guest.set_flags(send_coll_stuff=False)
+            self.hose_conn.shutdown()
+            self.hose_conn = None
+
+    def __enter__(self):
+        self.start()
+        return self
+    def __exit__(self, *args):
+        self.stop()
+
+    def resync(self):
+        self.resyncs += 1
+        guest.set_flags(send_all_colls=True)
+
+    def _thread_func(self, hose_conn):
+        import queue
+        while True:
+            try:
+                data = hose_conn.queue.get()
+            except queue.ShutDown:
+                return
+            try:
+                self.handle(data)
+            except Exception:
+                traceback.print_exc()
+
+    def handle(self, data):
+        fp = io.BytesIO(data)
+        tag = fp.read(8).rstrip(b'\0').decode()
+        with self.lock:
+            if tag != 'normco*' and self.unconfirmed is not None:
+                # the resync is over; anything it didn't mention is gone
+                for addr in self.unconfirmed:
+                    self._remove(addr)
+                self.unconfirmed = None
+            if tag in ('normco+', 'normco*'):
+                rc = self._parse_collider(fp)
+                addr = rc.collider.addr
+                self.colliders[addr] = rc
+                self.changed.add(addr)
+                self.removed.discard(addr)
+                if self.unconfirmed is not None:
+                    self.unconfirmed.discard(addr)
+            elif tag == 'normco-':
+                addr, = struct.unpack('<Q', fp.read(8))
+                self._remove(addr)
+            elif tag == 'allcols':
+                self.unconfirmed = set(self.colliders)
+                self.scols = {}
+            elif tag == 'scolcol':
+                rs = self._parse_scol(fp)
+                self.scols[rs.scol.addr] = rs
+            elif tag == 'scolco~':
+                addr, = struct.unpack('<Q', fp.read(8))
+                if addr not in self.scols:
+                    print(f'ColliderRegistry: scolco~ for unknown scol {addr:#x}', file=sys.stderr)
+        if tag == 'overrun':
+            self.resync()
+
+    def _remove(self, addr):
+        if self.colliders.pop(addr, None) is not None:
+            self.changed.discard(addr)
+            self.removed.add(addr)
+
+    @staticmethod
+    def _parse_collider(fp):
+        rc = ReportedCollider()
+        addr, = struct.unpack('<Q', fp.read(8))
+        rc.collider = collider = Collider(addr).local(fp.read(0x3e0)) # initial_dump_size in main.cpp
+        rc.ext_pos_cur = struct.unpack('<2f', fp.read(8))
+        rc.ext_pos_old = struct.unpack('<2f', fp.read(8))
+        for kind in ('cur', 'old'):
+            segs = getattr(collider, f'segments_{kind}')
+            items = GuestArray(segs.base.addr, ColliderSegment, segs.count)
+            setattr(rc, f'segments_{kind}', items.local(fp.read(items.sizeof_star)))
+        rc.world_id, = struct.unpack('<B', fp.read(1))
+        return rc
+
+    @staticmethod
+    def _parse_scol(fp):
+        rs = ReportedScol()
+        addr, = struct.unpack('<Q', fp.read(8))
+        rs.scol = Scol(addr).local(fp.read(0x103c)) # ditto
+        rs.ext_pos_cur = struct.unpack('<2f', fp.read(8))
+        rs.ext_pos_old = struct.unpack('<2f', fp.read(8))
+        rs.world_id, = struct.unpack('<b', fp.read(1))
+        return rs
+
+    def take_changes(self):
+        '''(colliders added or updated, colliders removed) since the last call'''
+        with self.lock:
+            changed = [Collider(addr) for addr in sorted(self.changed)]
+            removed = [Collider(addr) for addr in sorted(self.removed)]
+            self.changed = set()
+            self.removed = set()
+        return (changed, removed)
+
+    def all_colliders(self):
+        with self.lock:
+            return sorted(Collider(addr) for addr in self.colliders)
+
 @commandlike
 def print_collider_sources():
     sources = collider_sources()
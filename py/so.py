@@ -13,10 +13,29 @@ try:
             return
         py_dir = Path(__file__).parent
         gdb_venv_path = py_dir / '.gdb_venv'
-        subprocess.check_call(['uv', 'sync', '-p', sys.executable], cwd=str(py_dir), env={
-            **os.environ,
-            'UV_PROJECT_ENVIRONMENT': str(gdb_venv_path),
-        })
+        # `uv sync` takes a while even when there's nothing to do, so skip it
+        # if the project files and the interpreter are the same as last time.
+        import hashlib
+        stamp_path = gdb_venv_path / '.sopy_synced'
+        def sync_stamp():
+            try:
+                files = [(py_dir / name).read_bytes() for name in ('pyproject.toml', 'uv.lock')]
+            except FileNotFoundError:
+                return None # never synced
+            return hashlib.sha256(b''.join([sys.executable.encode()] + files)).hexdigest()
+        stamp = sync_stamp()
+        try:
+            synced = stamp is not None and stamp_path.read_text() == stamp
+        except OSError:
+            synced = False
+        if not synced:
+            subprocess.check_call(['uv', 'sync', '-p', sys.executable], cwd=str(py_dir), env={
+                **os.environ,
+                'UV_PROJECT_ENVIRONMENT': str(gdb_venv_path),
+            })
+            # (after the sync, which may have rewritten uv.lock)
+            if (stamp := sync_stamp()) is not None:
+                stamp_path.write_text(stamp)
         site_packages_dirs = list(gdb_venv_path.glob('lib/python*/site-packages'))
         assert len(site_packages_dirs) == 1, site_packages_dirs
         sys.path.insert(0, str(site_packages_dirs[0]))
@@ -37,7 +56,9 @@ try:
                 globals()[_attr] = _attrval
 
     _sopy_load_into_venv()
-    _sopy_reload_all()
+    import smmboss
+    with smmboss.maybe_profile_startup('so.py startup'):
+        _sopy_reload_all()
 except:
     # GDB does not natively print traceback for exceptions encountered while
     # sourcing
@@ -0,0 +1,10 @@
+import smmboss
+
+def test_detached_world():
+    # export.py builds worlds with no guest behind them, for every build.
+    for build_id in smmboss.get_addrs_yaml():
+        mm = smmboss.MM.detached(build_id=build_id)
+        world = mm.world
+        assert mm.immutable_ranges() == []
+        assert world.cstr_intern.immutable_ranges == []
+        assert issubclass(world.ObjRec, world.GuestStruct)